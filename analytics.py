@@ -0,0 +1,446 @@
+"""
+Statistici de note pe cursuri și profesori, calculate pe un snapshot columnar.
+
+Snapshot-ul ține înrolările ca array-uri NumPy (id, student, index curs, notă)
+și cursurile ca array-uri separate (credite, profesor), deci modificarea unui
+curs nu atinge înrolările. Se construiește din SQL (fără obiecte ORM), este
+actualizat incremental la fiecare scriere din API și reîncărcat complet după
+ANALYTICS_SNAPSHOT_TTL secunde (sau la POST /stats/refresh), ca să prindă și
+scrierile făcute pe alte căi (scripturi, SQL direct, alte procese uvicorn).
+Reîncărcarea după TTL rulează pe un thread separat; cererile servesc între
+timp snapshot-ul curent.
+"""
+
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models_sql
+from config import ANALYTICS_SNAPSHOT_TTL
+from database_sql import SessionLocal
+
+PASS_GRADE = 5.0
+HISTOGRAM_EDGES = np.arange(0, 11)    # intervale de câte 1 punct, 0..10
+PERCENTILES = (10, 25, 50, 75, 90)
+LOAD_CHUNK_SIZE = 50000
+COMPACT_RATIO = 0.25                  # compactăm când >25% din rânduri sunt șterse
+
+class GradeSnapshot:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()  # o singură reîncărcare la un moment dat
+        self._journal = None                # scrieri primite în timpul unei reîncărcări
+        self._reloading = False             # reîncărcare în fundal în curs
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        # Cursuri (indexate prin course_idx)
+        self._course_index = {}             # curs_id → course_idx
+        self._course_ids = np.empty(0, dtype=np.int64)
+        self._course_credite = np.empty(0, dtype=np.float64)
+        self._course_prof = np.empty(0, dtype=np.int32)   # -1 = fără profesor
+        self._course_valid = np.empty(0, dtype=bool)
+        self._professors = {}               # nume → cod
+        self._professor_names = []
+
+        # Înrolări (o linie per înrolare, sortate după id → căutare cu searchsorted)
+        self._enrollment_ids = np.empty(0, dtype=np.int64)
+        self._student_ids = np.empty(0, dtype=np.int64)
+        self._course_idx = np.empty(0, dtype=np.int32)
+        self._nota = np.empty(0, dtype=np.float64)        # NaN = fără notă
+        self._valid = np.empty(0, dtype=bool)
+        self._pending = []                  # înrolări noi, încă neadăugate în array-uri
+        self._pending_index = {}            # enrollment_id → poziție în _pending
+        self._deleted = 0
+
+    # --- Încărcare ---
+
+    def _build(self, db: Session):
+        """Construiește snapshot-ul din SQL, pe bucăți, direct în array-uri."""
+        with self._lock:
+            self._reset()
+
+            course_rows = db.execute(select(
+                models_sql.Course.id, models_sql.Course.credite, models_sql.Course.profesor
+            )).all()
+            for course_id, credite, profesor in course_rows:
+                self._add_course(course_id, credite, profesor)
+
+            result = db.execute(
+                select(
+                    models_sql.Enrollment.id,
+                    models_sql.Enrollment.student_id,
+                    models_sql.Enrollment.curs_id,
+                    models_sql.Enrollment.nota,
+                ).execution_options(yield_per=LOAD_CHUNK_SIZE)
+            )
+            chunks = []
+            for partition in result.partitions(LOAD_CHUNK_SIZE):
+                chunk = np.array(
+                    [(e_id, s_id, c_id, np.nan if nota is None else nota)
+                     for e_id, s_id, c_id, nota in partition],
+                    dtype=np.float64,
+                ).reshape(-1, 4)
+                chunks.append(chunk)
+            data = np.concatenate(chunks) if chunks else np.empty((0, 4))
+            data = data[np.argsort(data[:, 0], kind="stable")]
+
+            self._enrollment_ids = data[:, 0].astype(np.int64)
+            self._student_ids = data[:, 1].astype(np.int64)
+            lookup = self._course_index
+            self._course_idx = np.fromiter(
+                (lookup.get(c_id, -1) for c_id in data[:, 2].astype(np.int64)),
+                dtype=np.int32, count=len(data),
+            )
+            self._nota = data[:, 3].copy()
+            self._valid = self._course_idx >= 0
+            self.loaded = True
+
+    def _expired(self) -> bool:
+        return ANALYTICS_SNAPSHOT_TTL > 0 and time.monotonic() - self.loaded_at >= ANALYTICS_SNAPSHOT_TTL
+
+    def load(self, db: Session, force: bool = True):
+        """
+        (Re)construiește snapshot-ul într-o instanță nouă, fără să țină lock-ul
+        interogărilor pe durata citirii din SQL. Scrierile sosite între timp sunt
+        jurnalizate și reaplicate peste snapshot-ul nou înainte de înlocuire.
+        """
+        with self._load_lock:
+            if not force and self.loaded and not self._expired():
+                return  # reîncărcat între timp de alt thread
+            with self._lock:
+                self._journal = []
+            try:
+                fresh = GradeSnapshot()
+                fresh._build(db)
+                with self._lock:
+                    for method, args in self._journal:
+                        getattr(fresh, method)(*args)
+                    for name, value in vars(fresh).items():
+                        if name not in ("_lock", "_load_lock", "_journal", "_reloading", "loaded_at"):
+                            setattr(self, name, value)
+                    self.loaded_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._journal = None
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.load(db, force=False)
+        elif self._expired():
+            self.reload_in_background()
+
+    def reload_in_background(self):
+        """Pornește o reîncărcare pe un thread separat (cel mult una în curs)."""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name="analytics-reload", daemon=True).start()
+
+    def _background_reload(self):
+        # Sesiune proprie, pe primar: sesiunea cererii se închide înaintea thread-ului
+        db = SessionLocal()
+        try:
+            self.load(db, force=False)
+        except Exception as e:
+            print(f"Reîncărcarea statisticilor a eșuat: {e}")
+        finally:
+            db.close()
+            self._reloading = False
+
+    def _record(self, method: str, *args):
+        if self._journal is not None:
+            self._journal.append((method, args))
+
+    # --- Actualizări incrementale ---
+
+    def _professor_code(self, profesor):
+        if profesor is None:
+            return -1
+        if profesor not in self._professors:
+            self._professors[profesor] = len(self._professor_names)
+            self._professor_names.append(profesor)
+        return self._professors[profesor]
+
+    def _add_course(self, course_id, credite, profesor):
+        self._course_index[course_id] = len(self._course_ids)
+        self._course_ids = np.append(self._course_ids, course_id)
+        self._course_credite = np.append(self._course_credite, float(credite or 0))
+        self._course_prof = np.append(self._course_prof, np.int32(self._professor_code(profesor)))
+        self._course_valid = np.append(self._course_valid, True)
+
+    def upsert_course(self, course_id: int, credite: int, profesor):
+        with self._lock:
+            self._record("upsert_course", course_id, credite, profesor)
+            if not self.loaded:
+                return
+            idx = self._course_index.get(course_id)
+            if idx is None:
+                self._add_course(course_id, credite, profesor)
+                return
+            self._course_credite[idx] = float(credite or 0)
+            self._course_prof[idx] = self._professor_code(profesor)
+
+    def delete_course(self, course_id: int):
+        """Cursul și înrolările lui (CASCADE în SQL) dispar din statistici."""
+        with self._lock:
+            self._record("delete_course", course_id)
+            if not self.loaded:
+                return
+            idx = self._course_index.pop(course_id, None)
+            if idx is None:
+                return
+            self._course_valid[idx] = False
+            self._merge_pending()
+            self._invalidate(self._valid & (self._course_idx == idx))
+
+    def delete_student(self, student_id: int):
+        with self._lock:
+            self._record("delete_student", student_id)
+            if not self.loaded:
+                return
+            self._merge_pending()
+            self._invalidate(self._valid & (self._student_ids == student_id))
+
+    def upsert_enrollment(self, enrollment_id: int, student_id: int, curs_id: int, nota):
+        with self._lock:
+            self._record("upsert_enrollment", enrollment_id, student_id, curs_id, nota)
+            if not self.loaded:
+                return
+            idx = self._course_index.get(curs_id)
+            if idx is None:
+                # Curs necunoscut snapshot-ului → reconstruim la următoarea interogare
+                self.loaded = False
+                return
+            value = np.nan if nota is None else float(nota)
+            entry = (enrollment_id, student_id, idx, value)
+            position = self._pending_index.get(enrollment_id)
+            if position is not None:
+                self._pending[position] = entry
+                return
+            row = self._find_row(enrollment_id)
+            if row is None:
+                self._pending_index[enrollment_id] = len(self._pending)
+                self._pending.append(entry)
+            else:
+                self._student_ids[row] = student_id
+                self._course_idx[row] = idx
+                self._nota[row] = value
+                if not self._valid[row]:
+                    self._valid[row] = True
+                    self._deleted -= 1
+
+    def delete_enrollment(self, enrollment_id: int):
+        with self._lock:
+            self._record("delete_enrollment", enrollment_id)
+            if not self.loaded:
+                return
+            self._merge_pending()
+            row = self._find_row(enrollment_id)
+            if row is not None and self._valid[row]:
+                self._valid[row] = False
+                self._deleted += 1
+                self._maybe_compact()
+
+    def _find_row(self, enrollment_id: int):
+        """Rândul înrolării (validă sau ștearsă) în array-uri, sau None."""
+        row = int(np.searchsorted(self._enrollment_ids, enrollment_id))
+        if row < len(self._enrollment_ids) and self._enrollment_ids[row] == enrollment_id:
+            return row
+        return None
+
+    def _invalidate(self, mask):
+        removed = int(mask.sum())
+        if not removed:
+            return
+        self._valid &= ~mask
+        self._deleted += removed
+        self._maybe_compact()
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        pending = np.array(self._pending, dtype=np.float64)
+        self._enrollment_ids = np.concatenate([self._enrollment_ids, pending[:, 0].astype(np.int64)])
+        self._student_ids = np.concatenate([self._student_ids, pending[:, 1].astype(np.int64)])
+        self._course_idx = np.concatenate([self._course_idx, pending[:, 2].astype(np.int32)])
+        self._nota = np.concatenate([self._nota, pending[:, 3]])
+        self._valid = np.concatenate([self._valid, np.ones(len(pending), dtype=bool)])
+        first_new = len(self._enrollment_ids) - len(pending)
+        if first_new > 0 and pending[:, 0].min() <= self._enrollment_ids[first_new - 1]:
+            # ID-uri noi mai mici decât cele existente (rar) → resortăm
+            order = np.argsort(self._enrollment_ids, kind="stable")
+            self._enrollment_ids = self._enrollment_ids[order]
+            self._student_ids = self._student_ids[order]
+            self._course_idx = self._course_idx[order]
+            self._nota = self._nota[order]
+            self._valid = self._valid[order]
+        elif len(pending) > 1:
+            order = np.argsort(self._enrollment_ids[first_new:], kind="stable") + first_new
+            self._enrollment_ids[first_new:] = self._enrollment_ids[order]
+            self._student_ids[first_new:] = self._student_ids[order]
+            self._course_idx[first_new:] = self._course_idx[order]
+            self._nota[first_new:] = self._nota[order]
+        self._pending = []
+        self._pending_index = {}
+
+    def _maybe_compact(self):
+        if not len(self._valid) or self._deleted / len(self._valid) < COMPACT_RATIO:
+            return
+        keep = self._valid
+        self._enrollment_ids = self._enrollment_ids[keep]
+        self._student_ids = self._student_ids[keep]
+        self._course_idx = self._course_idx[keep]
+        self._nota = self._nota[keep]
+        self._valid = np.ones(len(self._enrollment_ids), dtype=bool)
+        self._deleted = 0
+
+    # --- Interogări ---
+
+    def _graded(self, mask=None):
+        """(note, credite, course_idx) pentru înrolările valide care au notă."""
+        self._merge_pending()
+        selected = self._valid & ~np.isnan(self._nota)
+        if mask is not None:
+            selected &= mask
+        course_idx = self._course_idx[selected]
+        return self._nota[selected], self._course_credite[course_idx], course_idx
+
+    def overview(self) -> dict:
+        with self._lock:
+            grades, weights, _ = self._graded()
+            stats = describe(grades, weights)
+            stats["enrollments"] = int(self._valid.sum())
+            return stats
+
+    def course_stats(self, course_id: int):
+        with self._lock:
+            idx = self._course_index.get(course_id)
+            if idx is None:
+                return None
+            self._merge_pending()
+            in_course = self._course_idx == idx
+            grades, weights, _ = self._graded(in_course)
+            stats = describe(grades, weights)
+            stats["curs_id"] = course_id
+            stats["credite"] = int(self._course_credite[idx])
+            code = self._course_prof[idx]
+            stats["profesor"] = self._professor_names[code] if code >= 0 else None
+            stats["enrollments"] = int((self._valid & in_course).sum())
+            return stats
+
+    def professor_stats(self, profesor: str):
+        with self._lock:
+            code = self._professors.get(profesor)
+            if code is None:
+                return None
+            in_prof = (self._course_prof == code) & self._course_valid
+            if not in_prof.any():
+                # Profesorul nu mai are cursuri (cursuri șterse sau reatribuite)
+                return None
+            self._merge_pending()
+            mask = in_prof[self._course_idx]
+            grades, weights, _ = self._graded(mask)
+            stats = describe(grades, weights)
+            stats["profesor"] = profesor
+            stats["courses"] = int(in_prof.sum())
+            stats["enrollments"] = int((self._valid & mask).sum())
+            return stats
+
+    def courses_summary(self) -> list:
+        """Statistici pentru toate cursurile dintr-o singură trecere (bincount/lexsort)."""
+        with self._lock:
+            grades, _, course_idx = self._graded()
+            n = len(self._course_ids)
+            counts = np.bincount(course_idx, minlength=n)
+            sums = np.bincount(course_idx, weights=grades, minlength=n)
+            passed = np.bincount(course_idx, weights=(grades >= PASS_GRADE), minlength=n)
+            enrolled = np.bincount(self._course_idx[self._valid], minlength=n)
+            medians = _group_medians(grades, course_idx, counts)
+
+            summary = []
+            for idx in np.flatnonzero(self._course_valid):
+                count = int(counts[idx])
+                code = self._course_prof[idx]
+                summary.append({
+                    "curs_id": int(self._course_ids[idx]),
+                    "credite": int(self._course_credite[idx]),
+                    "profesor": self._professor_names[code] if code >= 0 else None,
+                    "enrollments": int(enrolled[idx]),
+                    "graded": count,
+                    "mean": round(float(sums[idx] / count), 2) if count else None,
+                    "median": round(float(medians[idx]), 2) if count else None,
+                    "pass_rate": round(float(passed[idx] / count), 4) if count else None,
+                })
+            return summary
+
+    def professors_summary(self) -> list:
+        with self._lock:
+            grades, weights, course_idx = self._graded()
+            codes = self._course_prof[course_idx]
+            has_prof = codes >= 0
+            codes, grades, weights = codes[has_prof], grades[has_prof], weights[has_prof]
+            n = len(self._professor_names)
+            counts = np.bincount(codes, minlength=n)
+            weight_sums = np.bincount(codes, weights=weights, minlength=n)
+            weighted = np.bincount(codes, weights=grades * weights, minlength=n)
+            passed = np.bincount(codes, weights=(grades >= PASS_GRADE), minlength=n)
+
+            summary = []
+            for code, name in enumerate(self._professor_names):
+                count = int(counts[code])
+                if not count:
+                    continue
+                summary.append({
+                    "profesor": name,
+                    "graded": count,
+                    "weighted_mean": round(float(weighted[code] / weight_sums[code]), 2) if weight_sums[code] else None,
+                    "pass_rate": round(float(passed[code] / count), 4),
+                })
+            return summary
+
+def _group_medians(values, groups, counts):
+    """Mediana per grup: sortare după (grup, valoare) și citirea mijlocului fiecărui segment."""
+    medians = np.full(len(counts), np.nan)
+    if not len(values):
+        return medians
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[lo] + sorted_values[hi]) / 2
+    return medians
+
+def describe(grades: np.ndarray, weights: np.ndarray) -> dict:
+    """Distribuția notelor: medii (simplă și ponderată cu creditele), percentile, histogramă, promovabilitate."""
+    count = len(grades)
+    if count == 0:
+        return {"graded": 0, "mean": None, "weighted_mean": None, "std": None,
+                "min": None, "max": None, "percentiles": None, "histogram": None, "pass_rate": None}
+    histogram, _ = np.histogram(grades, bins=HISTOGRAM_EDGES)
+    weight_sum = weights.sum()
+    return {
+        "graded": count,
+        "mean": round(float(grades.mean()), 2),
+        "weighted_mean": round(float(np.dot(grades, weights) / weight_sum), 2) if weight_sum else None,
+        "std": round(float(grades.std()), 2),
+        "min": float(grades.min()),
+        "max": float(grades.max()),
+        "percentiles": {
+            f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(grades, PERCENTILES))
+        },
+        "histogram": {
+            f"{lo}-{hi}": int(n) for lo, hi, n in zip(HISTOGRAM_EDGES[:-1], HISTOGRAM_EDGES[1:], histogram)
+        },
+        "pass_rate": round(float((grades >= PASS_GRADE).mean()), 4),
+    }
+
+snapshot = GradeSnapshot()
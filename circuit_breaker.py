@@ -0,0 +1,107 @@
+"""
+Circuit breaker pe bază de rată de eșec.
+
+Stări:
+    closed    - apelurile trec; rezultatele intră într-o fereastră glisantă
+    open      - apelurile sunt refuzate imediat până expiră open_seconds
+    half_open - se permit câteva apeluri de probă; succes → closed, eșec → open;
+                o probă fără verdict după probe_timeout secunde → open
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 open_seconds: float = 30, half_open_probes: int = 1, probe_timeout: float = 10):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.probe_timeout = probe_timeout
+
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=window)  # True = succes, False = eșec
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._half_open_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._half_open_at = now
+        elif (self._state == HALF_OPEN and self._probes_in_flight >= self.half_open_probes
+              and now - self._half_open_at >= self.probe_timeout):
+            # Proba nu a raportat niciun rezultat → o considerăm eșuată
+            self._open()
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        print(f"Circuit breaker DESCHIS pentru {self.open_seconds}s.")
+
+    def allow_request(self) -> bool:
+        """Returnează False dacă apelul trebuie refuzat imediat (fast-fail)."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def release_probe(self):
+        """Eliberează o probă half-open fără verdict (apelul nu a ajuns la serviciu)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._results.clear()
+                print("Circuit breaker ÎNCHIS (proba a reușit).")
+                return
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            if self._state == OPEN:
+                return
+            self._results.append(False)
+            calls = len(self._results)
+            if calls >= self.min_calls:
+                failures = calls - sum(self._results)
+                if failures / calls >= self.failure_rate:
+                    self._open()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._results)
+            return {
+                "state": self._state,
+                "calls_in_window": calls,
+                "failures_in_window": calls - sum(self._results),
+            }
@@ -2,6 +2,21 @@ from sqlalchemy.orm import Session
 import models_sql
 import schemas
 
+def apply_changes(db: Session, db_obj, changes: dict) -> dict:
+    """
+    Aplică doar câmpurile care diferă efectiv de valorile curente.
+    SQLAlchemy include în UPDATE numai coloanele modificate; dacă nu s-a
+    schimbat nimic, nu se face niciun UPDATE/commit.
+    Returnează dicționarul modificărilor aplicate.
+    """
+    changed = {field: value for field, value in changes.items() if getattr(db_obj, field) != value}
+    if changed:
+        for field, value in changed.items():
+            setattr(db_obj, field, value)
+        db.commit()
+        db.refresh(db_obj)
+    return changed
+
 # --- Student CRUD ---
 def get_student(db: Session, student_id: int):
     return db.query(models_sql.Student).filter(models_sql.Student.id == student_id).first()
@@ -35,6 +50,12 @@ def update_student(db: Session, student_id: int, student: schemas.StudentCreate)
         db.refresh(db_student)
     return db_student
 
+def patch_student(db: Session, student_id: int, student: schemas.StudentUpdate):
+    db_student = get_student(db, student_id)
+    if db_student is None:
+        return None, {}
+    return db_student, apply_changes(db, db_student, student.changes())
+
 def delete_student(db: Session, student_id: int):
     db_student = db.query(models_sql.Student).filter(models_sql.Student.id == student_id).first()
     if db_student:
@@ -71,6 +92,12 @@ def update_course(db: Session, course_id: int, course: schemas.CourseCreate):
         db.refresh(db_course)
     return db_course
 
+def patch_course(db: Session, course_id: int, course: schemas.CourseUpdate):
+    db_course = get_course(db, course_id)
+    if db_course is None:
+        return None, {}
+    return db_course, apply_changes(db, db_course, course.changes())
+
 def delete_course(db: Session, course_id: int):
     db_course = db.query(models_sql.Course).filter(models_sql.Course.id == course_id).first()
     if db_course:
@@ -80,6 +107,9 @@ def delete_course(db: Session, course_id: int):
     return False
 
 # --- Enrollment CRUD ---
+def get_enrollment(db: Session, enrollment_id: int):
+    return db.query(models_sql.Enrollment).filter(models_sql.Enrollment.id == enrollment_id).first()
+
 def create_enrollment(db: Session, enrollment: schemas.EnrollmentCreate):
     db_enrollment = models_sql.Enrollment(
         student_id=enrollment.student_id,
@@ -103,6 +133,14 @@ def update_enrollment(db: Session, enrollment_id: int, enrollment: schemas.Enrol
         db.refresh(db_enrollment)
     return db_enrollment
 
+def patch_enrollment(db: Session, enrollment_id: int, enrollment: schemas.EnrollmentUpdate, db_enrollment=None):
+    # db_enrollment: înrolarea deja încărcată de apelant (evită încă un SELECT)
+    if db_enrollment is None:
+        db_enrollment = get_enrollment(db, enrollment_id)
+    if db_enrollment is None:
+        return None, {}
+    return db_enrollment, apply_changes(db, db_enrollment, enrollment.changes())
+
 def delete_enrollment(db: Session, enrollment_id: int):
     db_enrollment = db.query(models_sql.Enrollment).filter(models_sql.Enrollment.id == enrollment_id).first()
     if db_enrollment:
@@ -1,28 +1,405 @@
+import copy
+import functools
+import http.client
+import json
+import socket
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
 import couchdb
-from config import COUCHDB_URL, COUCHDB_DB_NAME
+from circuit_breaker import CircuitBreaker
+from config import (
+    COUCHDB_URL,
+    COUCHDB_DB_NAME,
+    COUCHDB_PARTITIONED,
+    COUCHDB_PARTITIONED_DB_NAME,
+    COUCHDB_TIMEOUT,
+    COUCHDB_BREAKER_WINDOW,
+    COUCHDB_BREAKER_MIN_CALLS,
+    COUCHDB_BREAKER_FAILURE_RATE,
+    COUCHDB_BREAKER_OPEN_SECONDS,
+    COUCHDB_BREAKER_HALF_OPEN_PROBES,
+    COUCHDB_BREAKER_PROBE_TIMEOUT,
+    COUCHDB_MAX_CONCURRENCY,
+    COUCHDB_ACQUIRE_TIMEOUT,
+    COUCHDB_DEFERRED_MAX,
+    COUCHDB_REPLAY_INTERVAL,
+    COUCHDB_REPLAY_MAX_ATTEMPTS,
+)
+
+class CouchDBUnavailable(Exception):
+    pass
+
+class CouchDBConflict(Exception):
+    """
+    Conflicte de revizie care persistă după reîncercările locale (scrieri
+    concurente pe același document). CouchDB este disponibil, deci nu contează
+    în breaker, dar operația trebuie reluată mai târziu, nu abandonată.
+    """
+
+# Serverul și handle-urile bazelor de date sunt refolosite între cereri
+# (un singur pool de conexiuni, fără HEAD /{db} la fiecare apel).
+_server = None
+_db_cache = {}
 
 def get_couchdb_server():
+    global _server
+    if _server is not None:
+        return _server
     try:
-        server = couchdb.Server(COUCHDB_URL)
-        return server
+        # Timeout scurt și fără reîncercări: eșecurile sunt gestionate de circuit breaker
+        session = couchdb.Session(timeout=COUCHDB_TIMEOUT, retry_delays=[])
+        _server = couchdb.Server(COUCHDB_URL, session=session)
+        return _server
     except Exception as e:
         print(f"Eroare conectare CouchDB: {e}")
         return None
 
-def get_couchdb_db():
+def get_couchdb_db(partitioned: bool = COUCHDB_PARTITIONED):
+    db_name = COUCHDB_PARTITIONED_DB_NAME if partitioned else COUCHDB_DB_NAME
+    if db_name in _db_cache:
+        return _db_cache[db_name]
     server = get_couchdb_server()
-    if server:
-        if COUCHDB_DB_NAME in server:
-            return server[COUCHDB_DB_NAME]
+    # Nu folosim `if server:` — Server.__bool__ face un HEAD și ar transforma
+    # o pană CouchDB într-un None tăcut, invizibil pentru circuit breaker.
+    if server is not None:
+        if db_name in server:
+            _db_cache[db_name] = server[db_name]
+            return _db_cache[db_name]
         else:
             # Creăm baza de date dacă nu există
             try:
-                return server.create(COUCHDB_DB_NAME)
+                if partitioned:
+                    # python-couchdb nu expune parametrul ?partitioned=true la create()
+                    server.resource.put_json(db_name, partitioned=True)
+                    _db_cache[db_name] = server[db_name]
+                    # View-urile partiționate trebuie să existe de la început
+                    ensure_partition_views(_db_cache[db_name])
+                else:
+                    _db_cache[db_name] = server.create(db_name)
+                return _db_cache[db_name]
             except Exception as e:
+                # Ajunge și la circuit breaker: CouchDB căzut nu trebuie să pară un succes
                 print(f"Eroare creare baza de date CouchDB: {e}")
+                raise CouchDBUnavailable(str(e)) from e
+    return None
+
+# --- Circuit breaker + backpressure ---
+# Toate apelurile publice din acest modul trec prin @couchdb_call:
+#   - circuit deschis sau niciun slot liber → fast-fail (fără să blocăm worker-ul)
+#   - scrierile eșuate/refuzate (inclusiv conflictele repetate) sunt amânate și reluate în paralel, în ordine per document
+#   - citirile eșuate ridică CouchDBUnavailable (API-ul răspunde 503)
+
+breaker = CircuitBreaker(
+    window=COUCHDB_BREAKER_WINDOW,
+    min_calls=COUCHDB_BREAKER_MIN_CALLS,
+    failure_rate=COUCHDB_BREAKER_FAILURE_RATE,
+    open_seconds=COUCHDB_BREAKER_OPEN_SECONDS,
+    half_open_probes=COUCHDB_BREAKER_HALF_OPEN_PROBES,
+    probe_timeout=COUCHDB_BREAKER_PROBE_TIMEOUT,
+)
+
+_slots = threading.BoundedSemaphore(COUCHDB_MAX_CONCURRENCY)
+_deferred = deque()
+_deferred_keys = Counter()          # documente cu operații amânate → câte
+_deferred_lock = threading.Lock()
+_deferred_dropped = 0
+_dead_letters = deque(maxlen=100)   # operații abandonate la reluare (erori deterministe)
+_replay_wakeup = threading.Event()
+_replay_thread = None
+_replay_lock = threading.Lock()     # un singur reluator (thread-ul de fundal sau drain_deferred)
+_replay_executor = ThreadPoolExecutor(max_workers=COUCHDB_MAX_CONCURRENCY, thread_name_prefix="couchdb-replay")
+_guard_state = threading.local()
+
+class _DeferredCall:
+    """O sincronizare amânată. Egalitatea este pe identitate (două apeluri identice rămân distincte)."""
+    __slots__ = ("func", "args", "kwargs", "keys", "conflicts")
+
+    def __init__(self, func, args, kwargs, keys):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.keys = keys
+        self.conflicts = 0              # reluări eșuate cu CouchDBConflict
+
+def _is_transport_error(e: Exception) -> bool:
+    """
+    Doar erorile de transport (socket, timeout, 5xx) înseamnă că CouchDB e indisponibil.
+    Restul (4xx, bug-uri precum ValueError/TypeError) sunt deterministe: reîncercarea
+    ar eșua identic, deci nu le amânăm și nu le numărăm în breaker.
+    """
+    if isinstance(e, (CouchDBUnavailable, socket.error, socket.timeout, http.client.HTTPException)):
+        return True
+    if isinstance(e, couchdb.ServerError):
+        # python-couchdb: ServerError((status, error))
+        status = e.args[0][0] if e.args and isinstance(e.args[0], tuple) else None
+        return status is None or status >= 500
+    return False
+
+def _guarded_run(func, args, kwargs, acquire_timeout: float = COUCHDB_ACQUIRE_TIMEOUT):
+    """
+    Rulează func cu un slot de concurență și înregistrează rezultatul în breaker.
+    Ridică CouchDBUnavailable dacă apelul nu a putut fi făcut sau a eșuat din
+    cauza transportului; CouchDBConflict și orice altă excepție sunt propagate
+    neschimbate.
+    """
+    # Slotul se ia înaintea breaker-ului: altfel o probă half-open consumată
+    # fără slot ar rămâne fără verdict și ar bloca circuitul.
+    if not _slots.acquire(timeout=acquire_timeout):
+        raise CouchDBUnavailable("prea multe apeluri CouchDB în curs")
+    if not breaker.allow_request():
+        _slots.release()
+        raise CouchDBUnavailable("circuit deschis")
+    _guard_state.active = True
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        if _is_transport_error(e):
+            breaker.record_failure()
+            raise CouchDBUnavailable(str(e) or type(e).__name__) from e
+        if isinstance(e, (couchdb.HTTPError, CouchDBConflict)):
+            # CouchDB a răspuns (4xx, conflicte) → serviciul este disponibil
+            breaker.record_success()
+        else:
+            breaker.release_probe()
+        raise
+    finally:
+        _guard_state.active = False
+        _slots.release()
+    breaker.record_success()
+    return result
+
+def _release_keys(call: _DeferredCall):
+    for key in call.keys:
+        _deferred_keys[key] -= 1
+        if _deferred_keys[key] <= 0:
+            del _deferred_keys[key]
+
+def _has_deferred(keys) -> bool:
+    with _deferred_lock:
+        return any(key in _deferred_keys for key in keys)
+
+def _defer(func, args, kwargs, keys, reason):
+    global _deferred_dropped
+    with _deferred_lock:
+        if len(_deferred) >= COUCHDB_DEFERRED_MAX:
+            oldest = _deferred.popleft()
+            _release_keys(oldest)
+            _deferred_dropped += 1
+            _dead_letters.append({"operation": oldest.func.__name__, "args": oldest.args,
+                                  "kwargs": oldest.kwargs, "error": "coada de sincronizări amânate plină"})
+            print("Coada de sincronizări amânate este plină; cea mai veche a fost eliminată.")
+        _deferred.append(_DeferredCall(func, args, kwargs, keys))
+        for key in keys:
+            _deferred_keys[key] += 1
+    print(f"Sincronizare {func.__name__} amânată ({reason}).")
+    _start_replay_thread()
+    _replay_wakeup.set()
+
+def _next_replay_batch(limit: int) -> list:
+    """
+    Primele operații din coadă care nu depind de o operație anterioară:
+    două operații pe același document nu intră în același lot, deci ordinea
+    per document se păstrează chiar dacă lotul rulează în paralel.
+    """
+    batch = []
+    blocked = set()
+    with _deferred_lock:
+        for call in _deferred:
+            if len(batch) >= limit:
+                break
+            if blocked.isdisjoint(call.keys):
+                batch.append(call)
+            blocked.update(call.keys)
+    return batch
+
+def _replay_one(call: _DeferredCall) -> bool:
+    """
+    Reia o operație amânată. False = de reîncercat mai târziu (CouchDB încă
+    indisponibil sau conflicte); operația rămâne în coadă.
+    """
+    try:
+        # Reluarea așteaptă un slot: concurează cu cererile API, nu le întrerupe
+        _guarded_run(call.func, copy.deepcopy(call.args), copy.deepcopy(call.kwargs),
+                     acquire_timeout=COUCHDB_TIMEOUT)
+    except CouchDBUnavailable:
+        return False
+    except CouchDBConflict as e:
+        call.conflicts += 1
+        if call.conflicts < COUCHDB_REPLAY_MAX_ATTEMPTS:
+            print(f"Sincronizare amânată {call.func.__name__}: {e}; reîncercare ulterioară.")
+            return False
+        _dead_letters.append({"operation": call.func.__name__, "args": call.args,
+                              "kwargs": call.kwargs, "error": repr(e)})
+        print(f"Sincronizare amânată {call.func.__name__} abandonată după {call.conflicts} reluări: {e}")
+    except Exception as e:
+        # Eroare deterministă (ex. date invalide): nu are sens să reîncercăm
+        _dead_letters.append({"operation": call.func.__name__, "args": call.args,
+                              "kwargs": call.kwargs, "error": repr(e)})
+        print(f"Sincronizare amânată {call.func.__name__} abandonată: {e}")
+    with _deferred_lock:
+        _deferred.remove(call)
+        _release_keys(call)
+    return True
+
+def replay_deferred(max_items: int = None) -> int:
+    """
+    Reia sincronizările amânate în loturi de până la COUCHDB_MAX_CONCURRENCY
+    operații paralele, păstrând ordinea operațiilor pe același document.
+    Se oprește după lotul în care CouchDB a fost indisponibil sau o operație a
+    avut din nou conflicte; o operație care eșuează determinist (sau de
+    COUCHDB_REPLAY_MAX_ATTEMPTS ori cu conflicte) este mutată în _dead_letters.
+    """
+    replayed = 0
+    with _replay_lock:
+        while max_items is None or replayed < max_items:
+            limit = COUCHDB_MAX_CONCURRENCY if max_items is None else min(COUCHDB_MAX_CONCURRENCY, max_items - replayed)
+            batch = _next_replay_batch(limit)
+            if not batch:
+                break
+            results = list(_replay_executor.map(_replay_one, batch))
+            replayed += sum(results)
+            if not all(results):
+                break
+    return replayed
+
+def drain_deferred(timeout: float = 60) -> int:
+    """
+    Reia sincron coada de sincronizări amânate până se golește sau expiră
+    timeout-ul. Pentru scripturi (ex. migrare) care se termină înainte ca
+    thread-ul de reluare să apuce să ruleze. Returnează câte au rămas.
+    """
+    deadline = time.monotonic() + timeout
+    while _deferred and time.monotonic() < deadline:
+        if replay_deferred() == 0:
+            time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+    return len(_deferred)
+
+def _replay_loop():
+    while True:
+        _replay_wakeup.wait(COUCHDB_REPLAY_INTERVAL)
+        _replay_wakeup.clear()
+        if _deferred and breaker.state != "open":
+            replayed = replay_deferred()
+            if replayed:
+                print(f"{replayed} sincronizări amânate reluate în CouchDB.")
+
+def _start_replay_thread():
+    global _replay_thread
+    with _deferred_lock:
+        if _replay_thread is None:
+            _replay_thread = threading.Thread(target=_replay_loop, name="couchdb-replay", daemon=True)
+            _replay_thread.start()
+
+def _ordering_keys(key, args, kwargs) -> tuple:
+    if key is None:
+        return ()
+    keys = key(*args, **kwargs)
+    if isinstance(keys, str):
+        return (keys,)
+    return tuple(k for k in keys if k is not None)
+
+def couchdb_call(defer: bool = True, key=None):
+    """
+    Decorator pentru apelurile către CouchDB.
+    defer=True  (scrieri): la indisponibilitate operația e amânată, apelul returnează None.
+    defer=False (citiri):  la indisponibilitate se ridică CouchDBUnavailable.
+    key: funcție cu aceeași semnătură care returnează documentul (sau documentele)
+    scrise, ca ID din layout-ul clasic. O scriere pe un document care are deja
+    operații amânate este amânată și ea, ca să nu le depășească.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Apel imbricat (o funcție protejată apelează alta): slotul e deja ocupat
+            if getattr(_guard_state, 'active', False):
+                return func(*args, **kwargs)
+            if not defer:
+                return _guarded_run(func, args, kwargs)
+            keys = _ordering_keys(key, args, kwargs)
+            # Copie a argumentelor: funcțiile de sync modifică dicționarele primite
+            snapshot = (copy.deepcopy(args), copy.deepcopy(kwargs))
+            if _has_deferred(keys):
+                _defer(func, *snapshot, keys, reason="operații anterioare pe același document în așteptare")
                 return None
+            try:
+                return _guarded_run(func, args, kwargs)
+            except (CouchDBUnavailable, CouchDBConflict) as e:
+                _defer(func, *snapshot, keys, reason=str(e))
+                return None
+        return wrapper
+    return decorator
+
+def couchdb_status() -> dict:
+    status = breaker.snapshot()
+    status["deferred"] = len(_deferred)
+    status["deferred_dropped"] = _deferred_dropped
+    status["dead_letters"] = len(_dead_letters)
+    return status
+
+# --- ID-uri documente ---
+# Layout clasic:      student_42, course_7, enrollment_1001
+# Layout partiționat: student42:student_42, course7:course_7, student42:enrollment_1001
+
+def student_partition(student_id) -> str:
+    return f"student{student_id}"
+
+def course_partition(course_id) -> str:
+    return f"course{course_id}"
+
+def student_doc_id(student_id, partitioned: bool = COUCHDB_PARTITIONED) -> str:
+    doc_id = f"student_{student_id}"
+    if partitioned:
+        return f"{student_partition(student_id)}:{doc_id}"
+    return doc_id
+
+def course_doc_id(course_id, partitioned: bool = COUCHDB_PARTITIONED) -> str:
+    doc_id = f"course_{course_id}"
+    if partitioned:
+        return f"{course_partition(course_id)}:{doc_id}"
+    return doc_id
+
+def enrollment_doc_id(enrollment_id, student_id=None, partitioned: bool = COUCHDB_PARTITIONED) -> str:
+    """
+    Înrolările sunt plasate în partiția studentului, deci în layout-ul
+    partiționat avem nevoie și de student_id.
+    """
+    doc_id = f"enrollment_{enrollment_id}"
+    if partitioned:
+        if student_id is None:
+            raise ValueError("student_id este necesar pentru ID-ul partiționat al unei înrolări")
+        return f"{student_partition(student_id)}:{doc_id}"
+    return doc_id
+
+def transcript_doc_id(student_id, partitioned: bool = COUCHDB_PARTITIONED) -> str:
+    doc_id = f"transcript_{student_id}"
+    if partitioned:
+        return f"{student_partition(student_id)}:{doc_id}"
+    return doc_id
+
+def legacy_to_partitioned_id(doc: dict):
+    """
+    Calculează ID-ul partiționat pentru un document din layout-ul clasic.
+    Returnează None pentru documentele care nu aparțin aplicației (ex. design docs)
+    și pentru cele fără student_id acolo unde partiția depinde de el; apelantul
+    le numără ca ignorate, fără să oprească migrarea.
+    """
+    doc_type = doc.get('type')
+    if doc_type in ('enrollment', 'transcript') and doc.get('student_id') is None:
+        return None
+    if doc_type == 'student':
+        return student_doc_id(doc.get('id'), partitioned=True)
+    if doc_type == 'course':
+        return course_doc_id(doc.get('id'), partitioned=True)
+    if doc_type == 'enrollment':
+        return enrollment_doc_id(doc.get('id'), doc.get('student_id'), partitioned=True)
+    if doc_type == 'transcript':
+        return transcript_doc_id(doc.get('student_id'), partitioned=True)
     return None
 
+@couchdb_call(key=lambda student_data: f"student_{student_data.get('id')}")
 def sync_student_to_couchdb(student_data: dict):
     """
     Sincronizează datele unui student în CouchDB.
@@ -33,9 +410,9 @@ def sync_student_to_couchdb(student_data: dict):
         print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
         return
 
-    # Folosim email-ul ca ID unic sau generăm unul bazat pe ID-ul SQL
-    doc_id = f"student_{student_data.get('id')}"
-    
+    # Generăm ID-ul documentului pe baza ID-ului SQL
+    doc_id = student_doc_id(student_data.get('id'))
+
     # Verificăm dacă documentul există deja
     if doc_id in db:
         doc = db[doc_id]
@@ -51,6 +428,7 @@ def sync_student_to_couchdb(student_data: dict):
         db.save(student_data)
         print(f"Student {doc_id} creat în CouchDB.")
 
+@couchdb_call(key=lambda course_data: f"course_{course_data.get('id')}")
 def sync_course_to_couchdb(course_data: dict):
     """
     Sincronizează datele unui curs în CouchDB.
@@ -61,8 +439,8 @@ def sync_course_to_couchdb(course_data: dict):
         print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
         return
 
-    doc_id = f"course_{course_data.get('id')}"
-    
+    doc_id = course_doc_id(course_data.get('id'))
+
     if doc_id in db:
         doc = db[doc_id]
         doc.update(course_data)
@@ -75,18 +453,28 @@ def sync_course_to_couchdb(course_data: dict):
         db.save(course_data)
         print(f"Course {doc_id} creat în CouchDB.")
 
-def sync_enrollment_to_couchdb(enrollment_data: dict):
+@couchdb_call(key=lambda enrollment_data, previous_student_id=None: f"enrollment_{enrollment_data.get('id')}")
+def sync_enrollment_to_couchdb(enrollment_data: dict, previous_student_id=None):
     """
     Sincronizează datele unei înrolări în CouchDB.
     enrollment_data trebuie să fie un dicționar cu datele înrolării.
+    previous_student_id: student_id-ul dinaintea unui UPDATE; în layout-ul
+    partiționat, mutarea înrolării la alt student îi schimbă partiția (și ID-ul).
     """
     db = get_couchdb_db()
     if db is None:
         print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
         return
 
-    doc_id = f"enrollment_{enrollment_data.get('id')}"
-    
+    doc_id = enrollment_doc_id(enrollment_data.get('id'), enrollment_data.get('student_id'))
+
+    if COUCHDB_PARTITIONED and previous_student_id is not None \
+            and previous_student_id != enrollment_data.get('student_id'):
+        old_doc_id = enrollment_doc_id(enrollment_data.get('id'), previous_student_id)
+        if old_doc_id in db:
+            db.delete(db[old_doc_id])
+            print(f"Enrollment {old_doc_id} mutat în partiția {student_partition(enrollment_data.get('student_id'))}.")
+
     if doc_id in db:
         doc = db[doc_id]
         doc.update(enrollment_data)
@@ -98,3 +486,438 @@ def sync_enrollment_to_couchdb(enrollment_data: dict):
         enrollment_data['type'] = 'enrollment'
         db.save(enrollment_data)
         print(f"Enrollment {doc_id} creat în CouchDB.")
+
+# --- Ștergeri ---
+
+def _delete_doc(doc_id: str):
+    db = get_couchdb_db()
+    if db is None:
+        print("Nu s-a putut conecta la CouchDB pentru ștergere.")
+        return
+    if doc_id in db:
+        doc = db[doc_id]
+        db.delete(doc)
+
+@couchdb_call(key=lambda student_id: f"student_{student_id}")
+def delete_student_from_couchdb(student_id: int):
+    _delete_doc(student_doc_id(student_id))
+
+@couchdb_call(key=lambda course_id: f"course_{course_id}")
+def delete_course_from_couchdb(course_id: int):
+    _delete_doc(course_doc_id(course_id))
+
+@couchdb_call(key=lambda enrollment_id, student_id=None: f"enrollment_{enrollment_id}")
+def delete_enrollment_from_couchdb(enrollment_id: int, student_id=None):
+    _delete_doc(enrollment_doc_id(enrollment_id, student_id))
+
+# --- Interogări la nivel de partiție (doar layout partiționat) ---
+
+PARTITION_DESIGN_DOC = {
+    "_id": "_design/partition",
+    "language": "javascript",
+    "options": {"partitioned": True},
+    "views": {
+        "by_type": {
+            "map": "function (doc) { if (doc.type) { emit(doc.type, null); } }"
+        }
+    }
+}
+
+def ensure_partition_views(db=None):
+    """Creează (o singură dată) design document-ul cu view-urile partiționate."""
+    if db is None:
+        db = get_couchdb_db(partitioned=True)
+    if db is None:
+        return None
+    if PARTITION_DESIGN_DOC["_id"] not in db:
+        db.save(dict(PARTITION_DESIGN_DOC))
+    return db
+
+def _partitioned_db(db=None):
+    """
+    Baza partiționată pentru interogări pe partiție. Cu COUCHDB_PARTITIONED = False
+    documentele nu sunt acolo: ridicăm eroare în loc să creăm o bază goală.
+    """
+    if db is not None:
+        return db
+    if not COUCHDB_PARTITIONED:
+        raise ValueError("interogările pe partiție necesită COUCHDB_PARTITIONED = True")
+    return get_couchdb_db(partitioned=True)
+
+@couchdb_call(defer=False)
+def query_partition(partition: str, db=None, **options):
+    """
+    Citește documentele unei partiții (GET /{db}/_partition/{p}/_all_docs).
+    Cererea este servită de un singur shard.
+    """
+    db = _partitioned_db(db)
+    if db is None:
+        return []
+    options.setdefault('include_docs', True)
+    _, _, data = db.resource.get_json(['_partition', partition, '_all_docs'], **options)
+    return [row.get('doc', row) for row in data.get('rows', [])]
+
+@couchdb_call(defer=False)
+def query_partition_view(partition: str, design: str, view: str, db=None, **options):
+    """Interoghează un view partiționat (GET /{db}/_partition/{p}/_design/{d}/_view/{v})."""
+    db = _partitioned_db(db)
+    if db is None:
+        return []
+    if 'key' in options:
+        # Cheile view-urilor sunt JSON (ex. "enrollment" → "\"enrollment\"")
+        options['key'] = json.dumps(options['key'])
+    _, _, data = db.resource.get_json(
+        ['_partition', partition, '_design', design, '_view', view], **options
+    )
+    return data.get('rows', [])
+
+@couchdb_call(defer=False)
+def get_student_with_enrollments(student_id: int, db=None):
+    """
+    Returnează profilul unui student împreună cu înrolările lui,
+    citite dintr-o singură partiție.
+    """
+    docs = query_partition(student_partition(student_id), db=db)
+    student = None
+    enrollments = []
+    for doc in docs:
+        if doc.get('type') == 'student':
+            student = doc
+        elif doc.get('type') == 'enrollment':
+            enrollments.append(doc)
+    return {"student": student, "enrollments": enrollments}
+
+# --- Foi matricole (transcript) denormalizate ---
+# Un document transcript_<student_id> conține datele studentului și toate
+# înrolările lui, fiecare cu numele cursului, creditele și profesorul.
+# Este actualizat incremental la fiecare scriere, deci citirea unei foi
+# matricole înseamnă un singur GET, indiferent de volumul datelor.
+
+TRANSCRIPT_MAX_RETRIES = 3
+TRANSCRIPT_BATCH_SIZE = 200
+
+TRANSCRIPT_DESIGN_DOC = {
+    "_id": "_design/transcripts",
+    "language": "javascript",
+    # View global: un curs apare în foile matricole din toate partițiile
+    "options": {"partitioned": False},
+    "views": {
+        "by_course": {
+            "map": (
+                "function (doc) {"
+                " if (doc.type === 'transcript' && doc.enrollments) {"
+                # O singură emitere per (curs, foaie): perechea (cheie, doc id) e unică,
+                # ceea ce permite paginarea cu startkey_docid
+                "  var seen = {};"
+                "  doc.enrollments.forEach(function (e) {"
+                "   if (!seen[e.curs_id]) { seen[e.curs_id] = true; emit(e.curs_id, null); }"
+                "  });"
+                " }"
+                "}"
+            )
+        }
+    }
+}
+
+def compute_weighted_average(enrollments: list):
+    """Media notelor ponderată cu creditele; înrolările fără notă sunt ignorate."""
+    total_credits = 0
+    weighted_sum = 0.0
+    for entry in enrollments:
+        if entry.get('nota') is None or not entry.get('credite'):
+            continue
+        total_credits += entry['credite']
+        weighted_sum += entry['nota'] * entry['credite']
+    if total_credits == 0:
+        return None
+    return round(weighted_sum / total_credits, 2)
+
+def _refresh_transcript_totals(doc: dict):
+    enrollments = doc.get('enrollments', [])
+    enrollments.sort(key=lambda e: e.get('enrollment_id') or 0)
+    doc['credite_totale'] = sum(e.get('credite') or 0 for e in enrollments if e.get('nota') is not None)
+    doc['media_ponderata'] = compute_weighted_average(enrollments)
+
+def _new_transcript(student_id) -> dict:
+    return {
+        "_id": transcript_doc_id(student_id),
+        "type": "transcript",
+        "student_id": student_id,
+        "student": None,
+        "enrollments": [],
+    }
+
+def _update_transcript(db, student_id, mutate):
+    """
+    Read-modify-write pe foaia matricolă a unui student, cu reîncercare
+    la conflicte de revizie (scrieri concurente pe același student).
+    mutate(doc) modifică documentul; dacă returnează False nu se salvează.
+    Dacă toate încercările au conflicte ridică CouchDBConflict: operația
+    este amânată și reluată, nu pierdută.
+    """
+    doc_id = transcript_doc_id(student_id)
+    for _ in range(TRANSCRIPT_MAX_RETRIES):
+        doc = db.get(doc_id) or _new_transcript(student_id)
+        if mutate(doc) is False:
+            return
+        _refresh_transcript_totals(doc)
+        try:
+            db.save(doc)
+            return
+        except couchdb.ResourceConflict:
+            continue
+    raise CouchDBConflict(f"transcript {doc_id}: conflicte repetate")
+
+def _transcript_entry(enrollment_data: dict, course_data: dict) -> dict:
+    return {
+        "enrollment_id": enrollment_data.get('id'),
+        "curs_id": enrollment_data.get('curs_id'),
+        "nume_curs": course_data.get('nume_curs') if course_data else None,
+        "credite": course_data.get('credite') if course_data else None,
+        "profesor": course_data.get('profesor') if course_data else None,
+        "data_inrolare": enrollment_data.get('data_inrolare'),
+        "nota": enrollment_data.get('nota'),
+    }
+
+def _remove_entry(doc: dict, enrollment_id) -> bool:
+    before = len(doc['enrollments'])
+    doc['enrollments'] = [e for e in doc['enrollments'] if e.get('enrollment_id') != enrollment_id]
+    return len(doc['enrollments']) != before
+
+@couchdb_call(key=lambda student_data: f"transcript_{student_data.get('id')}")
+def sync_transcript_student(student_data: dict):
+    """Creează foaia matricolă a studentului sau îi actualizează datele personale."""
+    db = get_couchdb_db()
+    if db is None:
+        print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
+        return
+
+    student = {k: v for k, v in student_data.items() if not k.startswith('_') and k != 'type'}
+
+    def mutate(doc):
+        doc['student'] = student
+
+    _update_transcript(db, student_data.get('id'), mutate)
+
+def _transcript_enrollment_keys(enrollment_data, course_data, previous_student_id=None):
+    # O mutare la alt student scrie în ambele foi matricole
+    keys = [f"transcript_{enrollment_data.get('student_id')}"]
+    if previous_student_id is not None:
+        keys.append(f"transcript_{previous_student_id}")
+    return keys
+
+@couchdb_call(key=_transcript_enrollment_keys)
+def sync_transcript_enrollment(enrollment_data: dict, course_data: dict, previous_student_id=None):
+    """
+    Inserează/actualizează o înrolare în foaia matricolă a studentului.
+    Dacă înrolarea a fost mutată la alt student, o scoate din foaia veche.
+    """
+    db = get_couchdb_db()
+    if db is None:
+        print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
+        return
+
+    enrollment_id = enrollment_data.get('id')
+    student_id = enrollment_data.get('student_id')
+
+    if previous_student_id is not None and previous_student_id != student_id:
+        _update_transcript(db, previous_student_id, lambda doc: _remove_entry(doc, enrollment_id))
+
+    entry = _transcript_entry(enrollment_data, course_data)
+
+    def mutate(doc):
+        _remove_entry(doc, enrollment_id)
+        doc['enrollments'].append(entry)
+
+    _update_transcript(db, student_id, mutate)
+
+@couchdb_call(key=lambda enrollment_id, student_id: f"transcript_{student_id}")
+def remove_transcript_enrollment(enrollment_id: int, student_id: int):
+    db = get_couchdb_db()
+    if db is None:
+        print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
+        return
+    _update_transcript(db, student_id, lambda doc: _remove_entry(doc, enrollment_id))
+
+@couchdb_call(key=lambda student_id: f"transcript_{student_id}")
+def delete_transcript_from_couchdb(student_id: int):
+    _delete_doc(transcript_doc_id(student_id))
+
+@couchdb_call(defer=False)
+def get_transcript(student_id: int):
+    """Foaia matricolă a unui student: un singur document citit din CouchDB."""
+    db = get_couchdb_db()
+    if db is None:
+        return None
+    return db.get(transcript_doc_id(student_id))
+
+def ensure_transcript_views(db=None):
+    if db is None:
+        db = get_couchdb_db()
+    if db is None:
+        return None
+    existing = db.get(TRANSCRIPT_DESIGN_DOC["_id"])
+    if existing is None:
+        db.save(dict(TRANSCRIPT_DESIGN_DOC))
+    elif existing.get("views") != TRANSCRIPT_DESIGN_DOC["views"]:
+        # Design document creat de o versiune mai veche → actualizăm view-ul
+        existing["views"] = TRANSCRIPT_DESIGN_DOC["views"]
+        db.save(existing)
+    return db
+
+def _transcript_ids_for_course(db, course_id: int, batch_size: int):
+    """
+    ID-urile foilor matricole care conțin cursul, împărțite în loturi.
+    Paginare keyset (startkey_docid), nu skip: costul unei pagini nu crește
+    cu offset-ul, deci fiecare cerere rămâne sub COUCHDB_TIMEOUT.
+    """
+    doc_ids = []
+    options = {"startkey": course_id, "endkey": course_id, "limit": batch_size + 1}
+    while True:
+        rows = list(db.view('transcripts/by_course', **options))
+        doc_ids.extend(row.id for row in rows[:batch_size])
+        if len(rows) <= batch_size:
+            break
+        # Rândul în plus este începutul paginii următoare
+        options["startkey_docid"] = rows[batch_size].id
+    return [doc_ids[i:i + batch_size] for i in range(0, len(doc_ids), batch_size)]
+
+def _fan_out_course(course_id: int, mutate_entry, batch_size: int):
+    db = ensure_transcript_views()
+    if db is None:
+        print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
+        return
+
+    # Colectăm întâi toate ID-urile: salvarea loturilor modifică view-ul
+    # și ar deplasa paginarea cu skip.
+    batches = _transcript_ids_for_course(db, course_id, batch_size)
+
+    updated = 0
+    for doc_ids in batches:
+        pending = doc_ids
+        for _ in range(TRANSCRIPT_MAX_RETRIES):
+            docs = [row.doc for row in db.view('_all_docs', keys=pending, include_docs=True) if row.doc]
+            for doc in docs:
+                doc['enrollments'] = [e for e in (mutate_entry(e) for e in doc['enrollments']) if e is not None]
+                _refresh_transcript_totals(doc)
+            conflicts = []
+            for success, doc_id, _ in db.update(docs):
+                if success:
+                    updated += 1
+                else:
+                    conflicts.append(doc_id)
+            if not conflicts:
+                break
+            pending = conflicts
+        else:
+            # Reluarea reface toată propagarea; mutate_entry este idempotent
+            raise CouchDBConflict(
+                f"curs {course_id}: {len(pending)} foi matricole cu conflicte repetate ({updated} actualizate)"
+            )
+    print(f"Curs {course_id}: {updated} foi matricole actualizate.")
+
+@couchdb_call(key=lambda course_data, batch_size=None: f"transcripts_course_{course_data.get('id')}")
+def propagate_course_to_transcripts(course_data: dict, batch_size: int = TRANSCRIPT_BATCH_SIZE):
+    """
+    Propagă nume_curs/credite/profesor în toate foile matricole care conțin
+    cursul, în loturi de batch_size documente (_bulk_docs).
+    """
+    course_id = course_data.get('id')
+
+    def mutate_entry(entry):
+        if entry.get('curs_id') == course_id:
+            entry['nume_curs'] = course_data.get('nume_curs')
+            entry['credite'] = course_data.get('credite')
+            entry['profesor'] = course_data.get('profesor')
+        return entry
+
+    _fan_out_course(course_id, mutate_entry, batch_size)
+
+@couchdb_call(key=lambda course_id, batch_size=None: f"transcripts_course_{course_id}")
+def remove_course_from_transcripts(course_id: int, batch_size: int = TRANSCRIPT_BATCH_SIZE):
+    """Cursul a fost șters (CASCADE în SQL) → scoatem înrolările lui din foile matricole."""
+    def mutate_entry(entry):
+        return None if entry.get('curs_id') == course_id else entry
+
+    _fan_out_course(course_id, mutate_entry, batch_size)
+
+# --- Actualizări parțiale (PATCH) ---
+# Update handler-ul aplică pe server doar câmpurile modificate: un singur PUT,
+# fără GET-ul documentului întreg, și nicio revizie nouă dacă nimic nu diferă.
+
+SYNC_DESIGN_DOC = {
+    "_id": "_design/sync",
+    "language": "javascript",
+    "options": {"partitioned": False},
+    "updates": {
+        "patch": (
+            "function (doc, req) {"
+            " if (!doc) { return [null, {code: 404, json: {error: 'not_found'}}]; }"
+            " var changes = JSON.parse(req.body);"
+            " var changed = false;"
+            " for (var field in changes) {"
+            "  if (JSON.stringify(doc[field]) !== JSON.stringify(changes[field])) {"
+            "   doc[field] = changes[field]; changed = true;"
+            "  }"
+            " }"
+            " if (!changed) { return [null, {json: {ok: true, changed: false}}]; }"
+            " return [doc, {json: {ok: true, changed: true}}];"
+            "}"
+        )
+    }
+}
+
+_sync_design_ready = set()
+
+def _ensure_update_handler(db):
+    if db.name in _sync_design_ready:
+        return
+    existing = db.get(SYNC_DESIGN_DOC["_id"])
+    try:
+        if existing is None:
+            db.save(dict(SYNC_DESIGN_DOC))
+        elif existing.get("updates") != SYNC_DESIGN_DOC["updates"]:
+            # Handler creat de o versiune mai veche → îl actualizăm
+            existing["updates"] = SYNC_DESIGN_DOC["updates"]
+            db.save(existing)
+    except couchdb.ResourceConflict:
+        pass  # creat/actualizat între timp de alt worker
+    _sync_design_ready.add(db.name)
+
+def _patch_doc(doc_id: str, changes: dict) -> bool:
+    """
+    Trimite doar câmpurile modificate prin _design/sync/_update/patch.
+    Returnează False dacă documentul nu există (apelantul face sync complet).
+    """
+    db = get_couchdb_db()
+    if db is None:
+        print("Nu s-a putut conecta la CouchDB pentru sincronizare.")
+        return True
+    _ensure_update_handler(db)
+    try:
+        db.resource.put_json(['_design', 'sync', '_update', 'patch', doc_id], body=changes)
+    except couchdb.ResourceNotFound:
+        return False
+    print(f"Document {doc_id} actualizat parțial în CouchDB ({', '.join(changes)}).")
+    return True
+
+@couchdb_call(key=lambda student_data, changes: f"student_{student_data.get('id')}")
+def patch_student_in_couchdb(student_data: dict, changes: dict):
+    """changes: doar câmpurile modificate; student_data: studentul complet (pentru fallback)."""
+    if not _patch_doc(student_doc_id(student_data.get('id')), changes):
+        sync_student_to_couchdb(student_data)
+
+@couchdb_call(key=lambda course_data, changes: f"course_{course_data.get('id')}")
+def patch_course_in_couchdb(course_data: dict, changes: dict):
+    if not _patch_doc(course_doc_id(course_data.get('id')), changes):
+        sync_course_to_couchdb(course_data)
+
+@couchdb_call(key=lambda enrollment_data, changes, previous_student_id=None: f"enrollment_{enrollment_data.get('id')}")
+def patch_enrollment_in_couchdb(enrollment_data: dict, changes: dict, previous_student_id=None):
+    # În layout-ul partiționat, schimbarea studentului mută documentul în altă partiție
+    if COUCHDB_PARTITIONED and 'student_id' in changes:
+        sync_enrollment_to_couchdb(enrollment_data, previous_student_id=previous_student_id)
+        return
+    doc_id = enrollment_doc_id(enrollment_data.get('id'), enrollment_data.get('student_id'))
+    if not _patch_doc(doc_id, changes):
+        sync_enrollment_to_couchdb(enrollment_data)
@@ -1,19 +1,163 @@
-from sqlalchemy import create_engine
+import itertools
+import threading
+import time
+
+from sqlalchemy import create_engine, exc, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config import SQL_SERVER_CONNECTION_STRING
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Request
+from config import (
+    SQL_SERVER_CONNECTION_STRING,
+    SQL_ECHO,
+    SQL_READ_REPLICA_CONNECTION_STRINGS,
+    READ_YOUR_WRITES_SECONDS,
+    REPLICA_MAX_LAG_SECONDS,
+    REPLICA_LAG_CHECK_INTERVAL,
+    REPLICA_LAG_QUERY,
+)
+from profiling import install_sql_hooks
 
 # Creare engine SQLAlchemy
 # echo=True afișează query-urile SQL în consolă (util pentru debug)
-engine = create_engine(SQL_SERVER_CONNECTION_STRING, echo=True)
+engine = create_engine(SQL_SERVER_CONNECTION_STRING, echo=SQL_ECHO)
+
+# Durate per query pentru cererile profilate + jurnalul de query-uri lente
+install_sql_hooks(engine)
+
+# --- Replici read-only ---
+
+class Replica:
+    def __init__(self, connection_string: str):
+        self.engine = create_engine(connection_string, echo=SQL_ECHO, pool_pre_ping=True)
+        install_sql_hooks(self.engine)
+        self.name = self.engine.url.host
+        self.healthy = True
+        self.lag_seconds = None
+        self.server_name = None  # @@SERVERNAME, numele replicii în Availability Group
+
+replicas = [Replica(url) for url in SQL_READ_REPLICA_CONNECTION_STRINGS]
+_replica_cycle = itertools.cycle(replicas) if replicas else None
+_replica_lock = threading.Lock()
+
+def pick_replica():
+    """Round-robin printre replicile sănătoase; None dacă nu există niciuna."""
+    if _replica_cycle is None:
+        return None
+    with _replica_lock:
+        for _ in range(len(replicas)):
+            replica = next(_replica_cycle)
+            if replica.healthy:
+                return replica
+    return None
+
+def check_replica_lag(replica: Replica):
+    try:
+        # Verifică și că replica răspunde
+        with replica.engine.connect() as conn:
+            replica.server_name = conn.execute(text("SELECT @@SERVERNAME")).scalar()
+        # Lag-ul este citit de pe primar, relativ la primar
+        with engine.connect() as conn:
+            row = conn.execute(text(REPLICA_LAG_QUERY), {"replica": replica.server_name}).first()
+        replica.lag_seconds = row[0] if row is not None else None
+        if replica.lag_seconds is None:
+            # Niciun rând (baza nu e într-un AG) sau lag NULL (ex. data movement suspendat):
+            # prospețimea replicii nu poate fi garantată, deci nu o folosim
+            reason = "lag necunoscut"
+            healthy = False
+        else:
+            reason = f"lag={replica.lag_seconds}"
+            healthy = replica.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+    except Exception as e:
+        print(f"Replica {replica.name} indisponibilă: {e}")
+        replica.lag_seconds = None
+        reason = "indisponibilă"
+        healthy = False
+    if healthy != replica.healthy:
+        state = "readusă în rotație" if healthy else f"scoasă din rotație ({reason})"
+        print(f"Replica {replica.name} {state}.")
+    replica.healthy = healthy
+
+def _monitor_replicas():
+    while True:
+        for replica in replicas:
+            check_replica_lag(replica)
+        time.sleep(REPLICA_LAG_CHECK_INTERVAL)
+
+def start_replica_monitor():
+    if replicas:
+        threading.Thread(target=_monitor_replicas, name="replica-lag", daemon=True).start()
+
+def replica_status() -> list:
+    return [{"name": r.name, "healthy": r.healthy, "lag_seconds": r.lag_seconds} for r in replicas]
+
+class RoutingSession(Session):
+    """
+    Sesiune care citește de pe o replică (dacă i s-a atribuit una).
+    Flush-urile (INSERT/UPDATE/DELETE) merg întotdeauna pe primar.
+    """
+    replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica is not None and not self._flushing:
+            return self.replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
+# Cookie setat după o scriere: până la momentul indicat, clientul citește de pe primar
+READ_PRIMARY_COOKIE = "read_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+def reads_from_primary(request: Request) -> bool:
+    try:
+        until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+def _attach_replica(db: RoutingSession, replica: Replica):
+    """
+    Leagă sesiunea de replică și deschide conexiunea imediat (cu pre-ping), ca o
+    replică picată între două verificări să ducă la citire de pe primar, nu la 500.
+    """
+    db.replica = replica
+    try:
+        db.connection()
+    except exc.DBAPIError as e:
+        db.rollback()
+        db.replica = None
+        if replica.healthy:
+            replica.healthy = False
+            print(f"Replica {replica.name} scoasă din rotație (conexiune eșuată: {e}); citire de pe primar.")
+
+def get_db(request: Request):
+    db = SessionLocal()
+    # Doar cererile sigure (GET) pot citi de pe replică
+    if request.method in SAFE_METHODS and not reads_from_primary(request):
+        replica = pick_replica()
+        if replica is not None:
+            _attach_replica(db, replica)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_primary_db():
+    """Sesiune legată mereu de primar, pentru citiri care nu tolerează lag (ex. snapshot-ul de statistici)."""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def mark_write(response):
+    """Activează read-your-writes pentru clientul care tocmai a scris."""
+    if replicas and READ_YOUR_WRITES_SECONDS > 0:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE,
+            str(time.time() + READ_YOUR_WRITES_SECONDS),
+            max_age=READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+        )
@@ -1,23 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List
+from datetime import date
+import time
 
 import models_sql
 import schemas
 import crud
+import analytics
 import database_nosql
-from database_sql import engine, get_db
+import profiling
+import database_sql
+from database_sql import engine, get_db, get_primary_db
 
 # Creare tabele în baza de date SQL la pornire
 models_sql.Base.metadata.create_all(bind=engine)
 
+# Monitorizare lag replici read-only (dacă sunt configurate)
+database_sql.start_replica_monitor()
+
 app = FastAPI(
     title="Sistem Gestiune Studenți (Hibrid SQL + NoSQL)",
     description="API pentru sincronizarea datelor între SQL Server și CouchDB",
     version="1.0.0"
 )
 
+# Endpoint-urile declarate mai jos sunt profilate când cererea are un profil activ
+app.router.route_class = profiling.ProfiledRoute
+
 # ===== SECURITATE: CORS Middleware =====
 # Whitelist de origini permise (URL-uri care pot accesa API-ul)
 allowed_origins = [
@@ -32,14 +43,77 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,  # Doar aceste URL-uri pot face request-uri
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],  # Metode HTTP permise
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],  # Metode HTTP permise
     allow_headers=["*"],  # Header-e permise
 )
 
+# ===== Profilare la cerere =====
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    profile = profiling.start_profile(request)
+    if profile is None:
+        return await call_next(request)
+
+    token = profiling.current_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.current_profile.reset(token)
+        profile.duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        profiling.store_profile(profile)
+
+    sql_ms = sum(q["duration_ms"] for q in profile.queries)
+    response.headers["X-Profile-Id"] = profile.id
+    response.headers["Server-Timing"] = f"sql;dur={sql_ms:.2f}, total;dur={profile.duration_ms}"
+    return response
+
+# ===== Read-your-writes =====
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    # După o scriere reușită, clientul citește de pe primar (vezi database_sql.get_db)
+    if request.method not in database_sql.SAFE_METHODS and response.status_code < 400:
+        database_sql.mark_write(response)
+    return response
+
+def require_profiling_token(request: Request):
+    if not profiling.is_authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Profiling not authorized")
+
+@app.get("/debug/profiles", dependencies=[Depends(require_profiling_token)])
+def read_profiles():
+    return profiling.list_profiles()
+
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_profiling_token)])
+def read_profile(profile_id: str):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@app.get("/debug/slow-queries", dependencies=[Depends(require_profiling_token)])
+def read_slow_queries():
+    return list(reversed(profiling.slow_queries))
+
 @app.get("/")
 def read_root():
     return {"message": "Salut! API-ul este funcțional.", "docs": "/docs"}
 
+@app.get("/health/couchdb")
+def couchdb_health():
+    # Starea circuit breaker-ului și numărul de sincronizări amânate
+    return database_nosql.couchdb_status()
+
+@app.get("/health/replicas")
+def replicas_health():
+    # Replicile SQL read-only, lag-ul lor și dacă sunt în rotație
+    return database_sql.replica_status()
+
+def json_changes(changes: dict) -> dict:
+    # Datele (date) nu sunt serializabile JSON; CouchDB le primește ca ISO string
+    return {k: v.isoformat() if isinstance(v, date) else v for k, v in changes.items()}
+
 # --- Students Endpoints ---
 @app.post("/students/", response_model=schemas.Student)
 def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
@@ -60,6 +134,7 @@ def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)
         "data_nasterii": created_student.data_nasterii.isoformat() if created_student.data_nasterii else None
     }
     database_nosql.sync_student_to_couchdb(student_dict)
+    database_nosql.sync_transcript_student(student_dict)
     
     return created_student
 
@@ -75,6 +150,35 @@ def read_student(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Student not found")
     return db_student
 
+@app.get("/students/{student_id}/transcript")
+def read_student_transcript(student_id: int):
+    # Foaia matricolă este un singur document precalculat în CouchDB
+    try:
+        transcript = database_nosql.get_transcript(student_id)
+    except database_nosql.CouchDBUnavailable:
+        raise HTTPException(status_code=503, detail="CouchDB unavailable")
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return {k: v for k, v in transcript.items() if not k.startswith('_')}
+
+@app.get("/students/{student_id}/documents")
+def read_student_documents(student_id: int):
+    # Profilul și înrolările citite dintr-o singură partiție CouchDB (un singur shard)
+    if not database_nosql.COUCHDB_PARTITIONED:
+        raise HTTPException(status_code=404, detail="Partitioned CouchDB layout is disabled")
+    try:
+        documents = database_nosql.get_student_with_enrollments(student_id)
+    except database_nosql.CouchDBUnavailable:
+        raise HTTPException(status_code=503, detail="CouchDB unavailable")
+    if documents["student"] is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    def public(doc):
+        return {k: v for k, v in doc.items() if not k.startswith('_')}
+    return {
+        "student": public(documents["student"]),
+        "enrollments": [public(doc) for doc in documents["enrollments"]],
+    }
+
 @app.put("/students/{student_id}", response_model=schemas.Student)
 def update_student(student_id: int, student: schemas.StudentCreate, db: Session = Depends(get_db)):
     # 1. Actualizare în SQL Server
@@ -91,9 +195,37 @@ def update_student(student_id: int, student: schemas.StudentCreate, db: Session
         "data_nasterii": db_student.data_nasterii.isoformat() if db_student.data_nasterii else None
     }
     database_nosql.sync_student_to_couchdb(student_dict)
+    database_nosql.sync_transcript_student(student_dict)
     
     return db_student
 
+@app.patch("/students/{student_id}", response_model=schemas.Student)
+def patch_student(student_id: int, student: schemas.StudentUpdate, db: Session = Depends(get_db)):
+    if student.email is not None:
+        existing = crud.get_student_by_email(db, email=student.email)
+        if existing and existing.id != student_id:
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+    # 1. UPDATE în SQL Server doar pe coloanele modificate
+    db_student, changes = crud.patch_student(db=db, student_id=student_id, student=student)
+    if db_student is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    # Nimic nu s-a schimbat → nu scriem nici în CouchDB
+    if changes:
+        # 2. Sincronizare parțială în CouchDB (doar câmpurile modificate)
+        student_dict = {
+            "id": db_student.id,
+            "nume": db_student.nume,
+            "prenume": db_student.prenume,
+            "email": db_student.email,
+            "data_nasterii": db_student.data_nasterii.isoformat() if db_student.data_nasterii else None
+        }
+        database_nosql.patch_student_in_couchdb(dict(student_dict), json_changes(changes))
+        database_nosql.sync_transcript_student(student_dict)
+
+    return db_student
+
 @app.delete("/students/{student_id}")
 def delete_student(student_id: int, db: Session = Depends(get_db)):
     # 1. Ștergere din SQL Server
@@ -102,12 +234,9 @@ def delete_student(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Student not found")
     
     # 2. Ștergere din CouchDB
-    couch_db = database_nosql.get_couchdb_db()
-    if couch_db:
-        doc_id = f"student_{student_id}"
-        if doc_id in couch_db:
-            doc = couch_db[doc_id]
-            couch_db.delete(doc)
+    database_nosql.delete_student_from_couchdb(student_id)
+    database_nosql.delete_transcript_from_couchdb(student_id)
+    analytics.snapshot.delete_student(student_id)
     
     return {"message": "Student deleted successfully"}
 
@@ -125,6 +254,7 @@ def create_course(course: schemas.CourseCreate, db: Session = Depends(get_db)):
         "profesor": created_course.profesor
     }
     database_nosql.sync_course_to_couchdb(course_dict)
+    analytics.snapshot.upsert_course(created_course.id, created_course.credite, created_course.profesor)
     
     return created_course
 
@@ -140,7 +270,12 @@ def read_course(course_id: int, db: Session = Depends(get_db)):
     return db_course
 
 @app.put("/courses/{course_id}", response_model=schemas.Course)
-def update_course(course_id: int, course: schemas.CourseCreate, db: Session = Depends(get_db)):
+def update_course(course_id: int, course: schemas.CourseCreate, background_tasks: BackgroundTasks,
+                  db: Session = Depends(get_db)):
+    # Valorile vechi: foile matricole se actualizează doar dacă s-a schimbat ceva relevant
+    existing = crud.get_course(db, course_id=course_id)
+    previous = (existing.nume_curs, existing.credite, existing.profesor) if existing else None
+
     # 1. Actualizare în SQL Server
     db_course = crud.update_course(db=db, course_id=course_id, course=course)
     if db_course is None:
@@ -154,27 +289,66 @@ def update_course(course_id: int, course: schemas.CourseCreate, db: Session = De
         "profesor": db_course.profesor
     }
     database_nosql.sync_course_to_couchdb(course_dict)
+    analytics.snapshot.upsert_course(db_course.id, db_course.credite, db_course.profesor)
+
+    # 3. Propagare în foile matricole (în loturi, după trimiterea răspunsului)
+    if previous != (db_course.nume_curs, db_course.credite, db_course.profesor):
+        background_tasks.add_task(database_nosql.propagate_course_to_transcripts, dict(course_dict))
     
     return db_course
 
+@app.patch("/courses/{course_id}", response_model=schemas.Course)
+def patch_course(course_id: int, course: schemas.CourseUpdate, background_tasks: BackgroundTasks,
+                 db: Session = Depends(get_db)):
+    # 1. UPDATE în SQL Server doar pe coloanele modificate
+    db_course, changes = crud.patch_course(db=db, course_id=course_id, course=course)
+    if db_course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    # Nimic nu s-a schimbat → nu scriem nici în CouchDB
+    if changes:
+        course_dict = {
+            "id": db_course.id,
+            "nume_curs": db_course.nume_curs,
+            "credite": db_course.credite,
+            "profesor": db_course.profesor
+        }
+        # 2. Sincronizare parțială în CouchDB (doar câmpurile modificate)
+        database_nosql.patch_course_in_couchdb(dict(course_dict), json_changes(changes))
+        analytics.snapshot.upsert_course(db_course.id, db_course.credite, db_course.profesor)
+
+        # 3. Propagare în foile matricole (toate câmpurile cursului sunt denormalizate acolo)
+        background_tasks.add_task(database_nosql.propagate_course_to_transcripts, course_dict)
+
+    return db_course
+
 @app.delete("/courses/{course_id}")
-def delete_course(course_id: int, db: Session = Depends(get_db)):
+def delete_course(course_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     # 1. Ștergere din SQL Server
     success = crud.delete_course(db=db, course_id=course_id)
     if not success:
         raise HTTPException(status_code=404, detail="Course not found")
     
     # 2. Ștergere din CouchDB
-    couch_db = database_nosql.get_couchdb_db()
-    if couch_db:
-        doc_id = f"course_{course_id}"
-        if doc_id in couch_db:
-            doc = couch_db[doc_id]
-            couch_db.delete(doc)
+    database_nosql.delete_course_from_couchdb(course_id)
+    analytics.snapshot.delete_course(course_id)
+    # Înrolările cursului au fost șterse în cascadă → le scoatem și din foile matricole
+    background_tasks.add_task(database_nosql.remove_course_from_transcripts, course_id)
     
     return {"message": "Course deleted successfully"}
 
 # --- Enrollments Endpoints ---
+def course_to_dict(course):
+    # Datele cursului incluse în foaia matricolă
+    if course is None:
+        return None
+    return {
+        "id": course.id,
+        "nume_curs": course.nume_curs,
+        "credite": course.credite,
+        "profesor": course.profesor
+    }
+
 @app.post("/enrollments/", response_model=schemas.Enrollment)
 def create_enrollment(enrollment: schemas.EnrollmentCreate, db: Session = Depends(get_db)):
     # 1. Salvare în SQL Server
@@ -189,6 +363,12 @@ def create_enrollment(enrollment: schemas.EnrollmentCreate, db: Session = Depend
         "nota": created_enrollment.nota
     }
     database_nosql.sync_enrollment_to_couchdb(enrollment_dict)
+    analytics.snapshot.upsert_enrollment(
+        created_enrollment.id, created_enrollment.student_id, created_enrollment.curs_id, created_enrollment.nota
+    )
+
+    # 3. Actualizare incrementală a foii matricole
+    database_nosql.sync_transcript_enrollment(enrollment_dict, course_to_dict(created_enrollment.course))
     
     return created_enrollment
 
@@ -198,13 +378,17 @@ def read_enrollments(skip: int = 0, limit: int = 100, db: Session = Depends(get_
 
 @app.get("/enrollments/{enrollment_id}", response_model=schemas.Enrollment)
 def read_enrollment(enrollment_id: int, db: Session = Depends(get_db)):
-    db_enrollment = db.query(models_sql.Enrollment).filter(models_sql.Enrollment.id == enrollment_id).first()
+    db_enrollment = crud.get_enrollment(db, enrollment_id=enrollment_id)
     if db_enrollment is None:
         raise HTTPException(status_code=404, detail="Enrollment not found")
     return db_enrollment
 
 @app.put("/enrollments/{enrollment_id}", response_model=schemas.Enrollment)
 def update_enrollment(enrollment_id: int, enrollment: schemas.EnrollmentCreate, db: Session = Depends(get_db)):
+    # Reținem student_id-ul vechi: în layout-ul partiționat el determină partiția documentului
+    existing = crud.get_enrollment(db, enrollment_id=enrollment_id)
+    previous_student_id = existing.student_id if existing else None
+
     # 1. Actualizare în SQL Server
     db_enrollment = crud.update_enrollment(db=db, enrollment_id=enrollment_id, enrollment=enrollment)
     if db_enrollment is None:
@@ -218,23 +402,115 @@ def update_enrollment(enrollment_id: int, enrollment: schemas.EnrollmentCreate,
         "data_inrolare": db_enrollment.data_inrolare.isoformat() if db_enrollment.data_inrolare else None,
         "nota": db_enrollment.nota
     }
-    database_nosql.sync_enrollment_to_couchdb(enrollment_dict)
+    database_nosql.sync_enrollment_to_couchdb(enrollment_dict, previous_student_id=previous_student_id)
+    analytics.snapshot.upsert_enrollment(
+        db_enrollment.id, db_enrollment.student_id, db_enrollment.curs_id, db_enrollment.nota
+    )
+
+    # 3. Actualizare incrementală a foii matricole
+    database_nosql.sync_transcript_enrollment(
+        enrollment_dict, course_to_dict(db_enrollment.course), previous_student_id=previous_student_id
+    )
     
     return db_enrollment
 
+@app.patch("/enrollments/{enrollment_id}", response_model=schemas.Enrollment)
+def patch_enrollment(enrollment_id: int, enrollment: schemas.EnrollmentUpdate, db: Session = Depends(get_db)):
+    # Reținem student_id-ul vechi: în layout-ul partiționat el determină partiția documentului.
+    # Aceeași instanță este trimisă mai departe, deci înrolarea e citită o singură dată.
+    existing = crud.get_enrollment(db, enrollment_id=enrollment_id)
+    if existing is None:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
+    previous_student_id = existing.student_id
+
+    # 1. UPDATE în SQL Server doar pe coloanele modificate
+    db_enrollment, changes = crud.patch_enrollment(
+        db=db, enrollment_id=enrollment_id, enrollment=enrollment, db_enrollment=existing
+    )
+
+    # Nimic nu s-a schimbat → nu scriem nici în CouchDB
+    if changes:
+        enrollment_dict = {
+            "id": db_enrollment.id,
+            "student_id": db_enrollment.student_id,
+            "curs_id": db_enrollment.curs_id,
+            "data_inrolare": db_enrollment.data_inrolare.isoformat() if db_enrollment.data_inrolare else None,
+            "nota": db_enrollment.nota
+        }
+        # 2. Sincronizare parțială în CouchDB (doar câmpurile modificate)
+        database_nosql.patch_enrollment_in_couchdb(
+            dict(enrollment_dict), json_changes(changes), previous_student_id=previous_student_id
+        )
+        analytics.snapshot.upsert_enrollment(
+            db_enrollment.id, db_enrollment.student_id, db_enrollment.curs_id, db_enrollment.nota
+        )
+
+        # 3. Actualizare incrementală a foii matricole
+        database_nosql.sync_transcript_enrollment(
+            enrollment_dict, course_to_dict(db_enrollment.course), previous_student_id=previous_student_id
+        )
+
+    return db_enrollment
+
 @app.delete("/enrollments/{enrollment_id}")
 def delete_enrollment(enrollment_id: int, db: Session = Depends(get_db)):
+    # student_id este necesar pentru ID-ul documentului în layout-ul partiționat
+    db_enrollment = crud.get_enrollment(db, enrollment_id=enrollment_id)
+    if db_enrollment is None:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
+    student_id = db_enrollment.student_id
+
     # 1. Ștergere din SQL Server
     success = crud.delete_enrollment(db=db, enrollment_id=enrollment_id)
     if not success:
         raise HTTPException(status_code=404, detail="Enrollment not found")
     
     # 2. Ștergere din CouchDB
-    couch_db = database_nosql.get_couchdb_db()
-    if couch_db:
-        doc_id = f"enrollment_{enrollment_id}"
-        if doc_id in couch_db:
-            doc = couch_db[doc_id]
-            couch_db.delete(doc)
+    database_nosql.delete_enrollment_from_couchdb(enrollment_id, student_id)
+    analytics.snapshot.delete_enrollment(enrollment_id)
+    database_nosql.remove_transcript_enrollment(enrollment_id, student_id)
     
     return {"message": "Enrollment deleted successfully"}
+
+# --- Statistics Endpoints ---
+# Calculate pe snapshot-ul columnar din analytics.py (construit la primul apel,
+# apoi actualizat incremental de endpoint-urile de scriere de mai sus și
+# reîncărcat în fundal după ANALYTICS_SNAPSHOT_TTL).
+# Snapshot-ul se încarcă de pe primar: scrierile anterioare încărcării nu sunt
+# reaplicate, deci o replică în urmă le-ar pierde definitiv.
+@app.post("/stats/refresh")
+def stats_refresh(db: Session = Depends(get_primary_db)):
+    # Reîncărcare explicită (ex. după migrări sau scrieri directe în SQL)
+    analytics.snapshot.load(db)
+    return {"message": "Snapshot reloaded", "enrollments": analytics.snapshot.overview()["enrollments"]}
+
+@app.get("/stats/overview")
+def stats_overview(db: Session = Depends(get_primary_db)):
+    analytics.snapshot.ensure_loaded(db)
+    return analytics.snapshot.overview()
+
+@app.get("/stats/courses")
+def stats_courses(db: Session = Depends(get_primary_db)):
+    analytics.snapshot.ensure_loaded(db)
+    return analytics.snapshot.courses_summary()
+
+@app.get("/stats/courses/{course_id}")
+def stats_course(course_id: int, db: Session = Depends(get_primary_db)):
+    analytics.snapshot.ensure_loaded(db)
+    stats = analytics.snapshot.course_stats(course_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return stats
+
+@app.get("/stats/professors")
+def stats_professors(db: Session = Depends(get_primary_db)):
+    analytics.snapshot.ensure_loaded(db)
+    return analytics.snapshot.professors_summary()
+
+@app.get("/stats/professors/{profesor}")
+def stats_professor(profesor: str, db: Session = Depends(get_primary_db)):
+    analytics.snapshot.ensure_loaded(db)
+    stats = analytics.snapshot.professor_stats(profesor)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Professor not found")
+    return stats
@@ -6,8 +6,13 @@ din SQL Server în CouchDB (date create înainte de implementarea sincronizării
 
 Rulare:
     python migrate_to_couchdb.py
+    python migrate_to_couchdb.py --partitioned   # layout clasic → baza partiționată
 """
 
+import sys
+
+from sqlalchemy.orm import selectinload
+
 from database_sql import SessionLocal
 import models_sql
 import database_nosql
@@ -74,7 +79,101 @@ def migrate_enrollments():
     finally:
         db.close()
 
+def migrate_transcripts():
+    """Construiește foile matricole (transcript_<id>) pentru toți studenții"""
+    db = SessionLocal()
+    try:
+        courses = {c.id: c for c in db.query(models_sql.Course).all()}
+        students = db.query(models_sql.Student).options(selectinload(models_sql.Student.enrollments)).all()
+        print(f"\n🔄 Construire {len(students)} foi matricole...")
+
+        for student in students:
+            database_nosql.sync_transcript_student({
+                "id": student.id,
+                "nume": student.nume,
+                "prenume": student.prenume,
+                "email": student.email,
+                "data_nasterii": student.data_nasterii.isoformat() if student.data_nasterii else None
+            })
+            for enrollment in student.enrollments:
+                course = courses.get(enrollment.curs_id)
+                course_dict = {
+                    "id": course.id,
+                    "nume_curs": course.nume_curs,
+                    "credite": course.credite,
+                    "profesor": course.profesor
+                } if course else None
+                database_nosql.sync_transcript_enrollment({
+                    "id": enrollment.id,
+                    "student_id": enrollment.student_id,
+                    "curs_id": enrollment.curs_id,
+                    "data_inrolare": enrollment.data_inrolare.isoformat() if enrollment.data_inrolare else None,
+                    "nota": enrollment.nota
+                }, course_dict)
+
+        database_nosql.ensure_transcript_views()
+        print(f"✅ {len(students)} foi matricole construite!")
+    finally:
+        db.close()
+
+def migrate_to_partitioned(batch_size: int = 500):
+    """
+    Copiază documentele din baza clasică (students_sync) în baza partiționată,
+    rescriind ID-urile: student_42 → student42:student_42,
+    enrollment_1001 → student42:enrollment_1001.
+    Documentele deja existente în baza partiționată sunt suprascrise.
+    """
+    source = database_nosql.get_couchdb_db(partitioned=False)
+    target = database_nosql.get_couchdb_db(partitioned=True)
+    if source is None or target is None:
+        print("❌ Nu s-a putut conecta la CouchDB.")
+        return
+
+    print(f"\n🔄 Migrare layout clasic → partiționat ({target.name})...")
+    database_nosql.ensure_partition_views(target)
+    database_nosql.ensure_transcript_views(target)
+
+    batch = []
+    migrated = 0
+    skipped = 0
+    for row in source.view('_all_docs', include_docs=True):
+        doc = dict(row.doc)
+        new_id = database_nosql.legacy_to_partitioned_id(doc)
+        if new_id is None:
+            skipped += 1
+            continue
+        doc.pop('_rev', None)
+        doc['_id'] = new_id
+        if new_id in target:
+            doc['_rev'] = target[new_id].rev
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            migrated += _save_batch(target, batch)
+            batch = []
+    if batch:
+        migrated += _save_batch(target, batch)
+
+    print(f"✅ {migrated} documente migrate, {skipped} ignorate!")
+
+def _save_batch(db, docs):
+    """Salvează un lot prin _bulk_docs și raportează conflictele."""
+    saved = 0
+    for success, doc_id, result in db.update(docs):
+        if success:
+            saved += 1
+        else:
+            print(f"⚠️  {doc_id}: {result}")
+    return saved
+
 if __name__ == "__main__":
+    if "--partitioned" in sys.argv:
+        print("=" * 60)
+        print("🚀 MIGRARE COUCHDB: LAYOUT CLASIC → PARTIȚIONAT")
+        print("=" * 60)
+        migrate_to_partitioned()
+        print("\nSetează COUCHDB_PARTITIONED = True în config.py pentru a folosi noul layout.")
+        sys.exit(0)
+
     print("=" * 60)
     print("🚀 MIGRARE INIȚIALĂ SQL SERVER → COUCHDB")
     print("=" * 60)
@@ -82,8 +181,21 @@ if __name__ == "__main__":
     migrate_students()
     migrate_courses()
     migrate_enrollments()
+    migrate_transcripts()
+
+    # Sincronizările eșuate temporar sunt amânate în memorie; le reluăm aici,
+    # altfel s-ar pierde la ieșirea din script.
+    remaining = database_nosql.drain_deferred()
+    status = database_nosql.couchdb_status()
     
     print("\n" + "=" * 60)
+    if remaining or status["dead_letters"] or status["deferred_dropped"]:
+        print("⚠️  MIGRARE INCOMPLETĂ!")
+        print(f"   {remaining} sincronizări nu au ajuns în CouchDB, "
+              f"{status['dead_letters']} abandonate, {status['deferred_dropped']} eliminate din coadă.")
+        print("=" * 60)
+        print("\nRulează din nou scriptul după ce CouchDB este disponibil.")
+        sys.exit(1)
     print("✅ MIGRARE COMPLETĂ!")
     print("=" * 60)
     print("\nVerifică CouchDB: http://localhost:5984/_utils")
@@ -0,0 +1,238 @@
+"""
+Profilare la cerere și jurnal de query-uri lente.
+
+- O cerere marcată pentru profilare (header X-Profile-Token sau eșantionare)
+  primește un profil cProfile al endpoint-ului și lista query-urilor SQL
+  executate, cu durate. Profilul se citește din GET /debug/profiles/{id}.
+- Query-urile peste SLOW_QUERY_THRESHOLD_MS sunt reținute cu parametrii
+  lor și, pe SQL Server, cu planul de execuție estimat (SHOWPLAN_XML).
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import io
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from config import (
+    PROFILING_TOKEN,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_MAX_STORED,
+    SLOW_QUERY_THRESHOLD_MS,
+    SLOW_QUERY_CAPTURE_PLAN,
+    SLOW_QUERY_MAX_STORED,
+)
+
+PROFILE_HEADER = "X-Profile-Token"
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.utcnow().isoformat()
+        self.duration_ms = None
+        self.queries = []
+        self.call_stack = None
+        self._lock = threading.Lock()
+
+    def add_query(self, statement: str, duration_ms: float):
+        with self._lock:
+            self.queries.append({"statement": statement, "duration_ms": round(duration_ms, 2)})
+
+    def to_dict(self) -> dict:
+        sql_ms = sum(q["duration_ms"] for q in self.queries)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "sql_total_ms": round(sql_ms, 2),
+            "sql_count": len(self.queries),
+            "queries": self.queries,
+            "call_stack": self.call_stack,
+        }
+
+# --- Stocare în memorie ---
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+slow_queries = deque(maxlen=SLOW_QUERY_MAX_STORED)
+
+def store_profile(profile: RequestProfile):
+    with _profiles_lock:
+        _profiles[profile.id] = profile
+        while len(_profiles) > PROFILING_MAX_STORED:
+            _profiles.popitem(last=False)
+
+def get_profile(profile_id: str):
+    with _profiles_lock:
+        profile = _profiles.get(profile_id)
+    return profile.to_dict() if profile else None
+
+def list_profiles() -> list:
+    with _profiles_lock:
+        profiles = list(_profiles.values())
+    return [
+        {"id": p.id, "method": p.method, "path": p.path,
+         "duration_ms": p.duration_ms, "sql_count": len(p.queries)}
+        for p in reversed(profiles)
+    ]
+
+# --- Decizia de profilare ---
+
+def is_authorized(headers) -> bool:
+    token = headers.get(PROFILE_HEADER)
+    if PROFILING_TOKEN is None or token is None:
+        return False
+    # Comparație în timp constant: durata nu trebuie să dezvăluie prefixul corect
+    return hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+def start_profile(request):
+    """Returnează un RequestProfile dacă cererea trebuie profilată, altfel None."""
+    if is_authorized(request.headers):
+        reason = "header"
+    elif PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+        reason = "sample"
+    else:
+        return None
+    return RequestProfile(request.method, request.url.path, reason)
+
+# --- Profilarea endpoint-urilor ---
+# Endpoint-urile sincrone rulează în threadpool, deci cProfile trebuie pornit
+# în thread-ul endpoint-ului, nu în middleware (care rulează în event loop).
+
+def _format_stats(profiler: cProfile.Profile, limit: int = 40) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+# Un singur cProfile poate fi activ în proces (pe Python 3.12 este construit pe
+# sys.monitoring, iar un al doilea enable() ridică ValueError). Cererile profilate
+# care se suprapun primesc doar duratele SQL, fără call stack.
+_profiler_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _call_stack(profile):
+    if profile is None or not _profiler_lock.acquire(blocking=False):
+        if profile is not None:
+            profile.call_stack = "profiler ocupat de altă cerere; doar durate SQL"
+        yield
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Alt instrument de profilare/debug este deja activ
+            profile.call_stack = f"profiler indisponibil: {e}"
+            profiler = None
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profile.call_stack = _format_stats(profiler)
+    finally:
+        _profiler_lock.release()
+
+def _profiled(endpoint):
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            with _call_stack(current_profile.get()):
+                return await endpoint(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        with _call_stack(current_profile.get()):
+            return endpoint(*args, **kwargs)
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """Route care profilează endpoint-ul când cererea curentă are un profil activ."""
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+# --- Hook-uri SQLAlchemy ---
+
+_plan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="showplan")
+
+def _capture_plan(engine, statement, parameters, record):
+    """
+    Plan estimat pe o conexiune separată: cu SHOWPLAN_XML ON, SQL Server
+    returnează planul fără să execute instrucțiunea.
+    """
+    try:
+        connection = engine.raw_connection()
+    except Exception as e:
+        record["plan_error"] = str(e)
+        return
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET SHOWPLAN_XML ON")
+        try:
+            cursor.execute(statement, parameters)
+            row = cursor.fetchone()
+            record["plan"] = row[0] if row else None
+        finally:
+            cursor.execute("SET SHOWPLAN_XML OFF")
+    except Exception as e:
+        record["plan_error"] = str(e)
+        # Conexiunea poate fi rămas în modul SHOWPLAN: nu o returnăm în pool,
+        # altfel query-urile aplicației ar primi planuri în loc de rezultate
+        connection.invalidate()
+    finally:
+        connection.close()
+
+def install_sql_hooks(engine):
+    # Momentul de start stă pe contextul execuției, nu în conn.info: o instrucțiune
+    # eșuată nu ajunge la after_cursor_execute și ar lăsa intrări orfane pe conexiunea din pool
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiling_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_profiling_start", None)
+        if start is None:
+            return
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        profile = current_profile.get()
+        if profile is not None:
+            profile.add_query(statement, duration_ms)
+
+        if duration_ms >= SLOW_QUERY_THRESHOLD_MS:
+            record = {
+                "at": datetime.utcnow().isoformat(),
+                "duration_ms": round(duration_ms, 2),
+                "statement": statement,
+                "parameters": repr(parameters),
+                "profile_id": profile.id if profile else None,
+            }
+            slow_queries.append(record)
+            print(f"Query lent ({record['duration_ms']} ms): {statement}")
+            if SLOW_QUERY_CAPTURE_PLAN and engine.dialect.name == "mssql" and not executemany:
+                _plan_executor.submit(_capture_plan, engine, statement, parameters, record)
@@ -1,7 +1,26 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, model_validator
+from typing import Optional, List, ClassVar, Tuple
 from datetime import date
 
+# --- Partial updates (PATCH) ---
+class PartialUpdate(BaseModel):
+    """
+    Baza schemelor de PATCH: toate câmpurile sunt opționale, iar doar cele
+    trimise efectiv de client (model_fields_set) sunt considerate modificări.
+    """
+    # Câmpuri care pot lipsi din cerere, dar nu pot fi setate explicit la null
+    non_nullable: ClassVar[Tuple[str, ...]] = ()
+
+    @model_validator(mode="after")
+    def check_non_nullable(self):
+        for field in self.non_nullable:
+            if field in self.model_fields_set and getattr(self, field) is None:
+                raise ValueError(f"{field} cannot be null")
+        return self
+
+    def changes(self) -> dict:
+        return self.model_dump(exclude_unset=True)
+
 # --- Student Schemas ---
 class StudentBase(BaseModel):
     nume: str
@@ -12,6 +31,14 @@ class StudentBase(BaseModel):
 class StudentCreate(StudentBase):
     pass
 
+class StudentUpdate(PartialUpdate):
+    non_nullable: ClassVar[Tuple[str, ...]] = ("nume", "prenume", "email", "data_nasterii")
+
+    nume: Optional[str] = None
+    prenume: Optional[str] = None
+    email: Optional[EmailStr] = None
+    data_nasterii: Optional[date] = None
+
 class Student(StudentBase):
     id: int
     
@@ -27,6 +54,13 @@ class CourseBase(BaseModel):
 class CourseCreate(CourseBase):
     pass
 
+class CourseUpdate(PartialUpdate):
+    non_nullable: ClassVar[Tuple[str, ...]] = ("nume_curs", "credite")
+
+    nume_curs: Optional[str] = None
+    credite: Optional[int] = None
+    profesor: Optional[str] = None
+
 class Course(CourseBase):
     id: int
 
@@ -43,6 +77,14 @@ class EnrollmentBase(BaseModel):
 class EnrollmentCreate(EnrollmentBase):
     pass
 
+class EnrollmentUpdate(PartialUpdate):
+    non_nullable: ClassVar[Tuple[str, ...]] = ("student_id", "curs_id", "data_inrolare")
+
+    student_id: Optional[int] = None
+    curs_id: Optional[int] = None
+    data_inrolare: Optional[date] = None
+    nota: Optional[float] = None
+
 class Enrollment(EnrollmentBase):
     id: int
 
@@ -6,8 +6,10 @@ Testează:
 2. Verificare consistență
 3. Actualizare student
 4. Verificare sync UPDATE
-5. Ștergere student
-6. Verificare sync DELETE
+5. Actualizare parțială (PATCH) a unei înrolări
+6. Verificare sync PATCH și că un PATCH fără modificări nu scrie în CouchDB
+7. Ștergere student
+8. Verificare sync DELETE
 
 Rulare:
     python test_consistency.py
@@ -94,9 +96,76 @@ def test_update_student(student_id):
         print(f"❌ Document nu există în CouchDB după UPDATE")
         return False
 
+def test_patch_enrollment(student_id):
+    """Test PATCH + sync parțial (update handler) + PATCH fără modificări"""
+    print(f"\n🧪 TEST 3: PATCH Enrollment (student ID={student_id})")
+    
+    # 1. Pregătire: curs + înrolare pentru studentul de test
+    course_response = requests.post(f"{BASE_URL}/courses/", json={
+        "nume_curs": f"Test Patch {int(time.time())}",
+        "credite": 5,
+        "profesor": "Test"
+    })
+    if course_response.status_code != 200:
+        print(f"❌ Eroare creare curs: {course_response.status_code}")
+        return False
+    course_id = course_response.json()['id']
+    
+    enrollment_response = requests.post(f"{BASE_URL}/enrollments/", json={
+        "student_id": student_id,
+        "curs_id": course_id,
+        "data_inrolare": date.today().isoformat(),
+        "nota": 7.0
+    })
+    if enrollment_response.status_code != 200:
+        print(f"❌ Eroare creare înrolare: {enrollment_response.status_code}")
+        requests.delete(f"{BASE_URL}/courses/{course_id}")
+        return False
+    enrollment_id = enrollment_response.json()['id']
+    
+    try:
+        # 2. PATCH doar pe nota
+        response = requests.patch(f"{BASE_URL}/enrollments/{enrollment_id}", json={"nota": 9.5})
+        if response.status_code != 200:
+            print(f"❌ Eroare PATCH: {response.status_code}")
+            return False
+        print(f"✅ Înrolare actualizată parțial în SQL")
+        
+        # 3. Verificare în CouchDB
+        time.sleep(0.5)
+        couch_response = requests.get(f"{COUCHDB_URL}/enrollment_{enrollment_id}")
+        if couch_response.status_code != 200:
+            print(f"❌ Document nu există în CouchDB după PATCH")
+            return False
+        couch_doc = couch_response.json()
+        if couch_doc.get('nota') != 9.5 or couch_doc.get('curs_id') != course_id:
+            print(f"❌ PATCH nu s-a sincronizat")
+            return False
+        print(f"✅ PATCH sincronizat corect în CouchDB")
+        
+        # 4. PATCH cu aceeași valoare → documentul nu trebuie rescris
+        rev_before = couch_doc['_rev']
+        response = requests.patch(f"{BASE_URL}/enrollments/{enrollment_id}", json={"nota": 9.5})
+        if response.status_code != 200:
+            print(f"❌ Eroare PATCH fără modificări: {response.status_code}")
+            return False
+        
+        time.sleep(0.5)
+        couch_doc = requests.get(f"{COUCHDB_URL}/enrollment_{enrollment_id}").json()
+        if couch_doc.get('_rev') == rev_before:
+            print(f"✅ PATCH fără modificări nu a rescris documentul (_rev neschimbat)")
+            return True
+        else:
+            print(f"❌ PATCH fără modificări a creat o revizie nouă ({rev_before} → {couch_doc.get('_rev')})")
+            return False
+    finally:
+        # 5. Curățenie
+        requests.delete(f"{BASE_URL}/enrollments/{enrollment_id}")
+        requests.delete(f"{BASE_URL}/courses/{course_id}")
+
 def test_delete_student(student_id):
     """Test DELETE + sync"""
-    print(f"\n🧪 TEST 3: DELETE Student (ID={student_id})")
+    print(f"\n🧪 TEST 4: DELETE Student (ID={student_id})")
     
     # 1. Ștergere via API
     response = requests.delete(f"{BASE_URL}/students/{student_id}")
@@ -126,6 +195,7 @@ def main():
     results = {
         "create": False,
         "update": False,
+        "patch": False,
         "delete": False
     }
     
@@ -138,6 +208,10 @@ def main():
         if test_update_student(student_id):
             results["update"] = True
         
+        # Test PATCH
+        if test_patch_enrollment(student_id):
+            results["patch"] = True
+        
         # Test DELETE
         if test_delete_student(student_id):
             results["delete"] = True
@@ -148,6 +222,7 @@ def main():
     print("=" * 60)
     print(f"CREATE + Sync: {'✅ PASS' if results['create'] else '❌ FAIL'}")
     print(f"UPDATE + Sync: {'✅ PASS' if results['update'] else '❌ FAIL'}")
+    print(f"PATCH  + Sync: {'✅ PASS' if results['patch'] else '❌ FAIL'}")
     print(f"DELETE + Sync: {'✅ PASS' if results['delete'] else '❌ FAIL'}")
     
     all_passed = all(results.values())